@@ -0,0 +1,77 @@
+import json
+
+from decouple import config
+
+from helper_func import print_status, to_number
+from instrumentation import Counters
+
+# Summarize all setups of a symbol that need the LLM in a single request
+batch_summaries = config("BATCH_SUMMARIES", default=True, cast=bool)
+
+SUMMARY_KEYS = (
+    "direction",
+    "entry",
+    "stop_loss",
+    "take_profit",
+    "rrr",
+    "stop_loss_pips",
+    "take_profit_pips",
+)
+DIRECTIONS = {"long": "Long", "short": "Short", "none": "None"}
+
+batch_stats = Counters("requests", "summaries", "fallbacks")
+
+
+def format_batch_input(setups):
+    # setups is a list of (filename, text), every text is tagged with its name
+    return "\n\n".join(f"### {name}\n{text.strip()}" for name, text in setups)
+
+
+def validate_summary(entry):
+    # Returns the summary with the schema of SUMMARY_SYSTEM_PROMPT, None when
+    # a key is missing or a value does not fit
+    if not isinstance(entry, dict) or any(key not in entry for key in SUMMARY_KEYS):
+        return None
+    direction = DIRECTIONS.get(str(entry["direction"]).strip().lower())
+    if direction is None:
+        return None
+    summary = {"direction": direction}
+    for key in SUMMARY_KEYS[1:]:
+        value = to_number(entry[key])
+        if value is None:
+            return None
+        summary[key] = value
+    return summary
+
+
+def parse_batch_response(text, filenames):
+    # Maps filename to its validated summary, entries that fail validation or
+    # are missing are left out so they can be summarized one by one
+    text = text.replace("```json", "").replace("```", "").strip()
+    try:
+        entries = json.loads(text)
+    except json.JSONDecodeError as e:
+        print_status(f"Batch summary is not valid JSON: {e}")
+        return {}
+    if not isinstance(entries, list):
+        print_status("Batch summary is not a JSON array")
+        return {}
+
+    summaries = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or entry.get("filename") not in filenames:
+            continue
+        summary = validate_summary(entry)
+        if summary is not None:
+            summaries[entry["filename"]] = summary
+    return summaries
+
+
+def print_batch_stats():
+    if not batch_stats["requests"]:
+        return
+    print_status(
+        f"Batch summaries: {batch_stats['requests']} requests, "
+        f"{batch_stats['summaries']} summaries, "
+        f"{batch_stats['fallbacks']} summarized one by one"
+    )
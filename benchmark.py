@@ -0,0 +1,653 @@
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import resource
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Offline benchmark: a fake TradingView page and a local OpenAI-compatible stub
+# replace the browser and OpenRouter, so throughput can be compared run to run
+# without API credits. Usage: python benchmark.py --symbols 10 --models 4
+
+BENCHMARK_SYMBOLS = ["EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "USDCAD", "XAUUSD"]
+BENCHMARK_TIMEFRAMES = ["1W", "1D", "4H", "1H", "15", "5"]
+
+SETUP_RESPONSE = """Instrument: {instrument}
+Analysis Timeframes Provided: Weekly, Daily, H4, H1
+
+**Analysis Summary & Confluence:**
+*   HTF uptrend with higher highs and higher lows.
+*   LTF pullback into the H4 demand zone.
+
+**Trading Setup:**
+Direction: Long
+Entry Order Type: Buy Limit
+Entry Price: {entry:.5f}
+Stop Loss: {stop_loss:.5f} (Justification: Below H4 demand)
+Take Profit: {take_profit:.5f} (Justification: Daily resistance)
+Risk/Reward Ratio: 2:1
+
+**Rationale:**
+Benchmark response.
+"""
+
+# Does not follow the output format, so the summary model has to extract it
+FREEFORM_RESPONSE = """The best idea is to go long around {entry:.5f}, with the stop at
+{stop_loss:.5f} and the target at {take_profit:.5f}, roughly two to one."""
+
+# Honesty clause answer, the explanation after the verdict is what an early
+# stop of a stream saves
+NO_SETUP_RESPONSE = """Instrument: {instrument}
+Analysis Timeframes Provided: Weekly, Daily, H4, H1
+
+**Analysis Summary & Confluence:**
+*   HTF range without a clear trend.
+*   LTF structure conflicts with the higher timeframes.
+
+No valid trading setup meets the criteria on these charts.
+
+Why no setup could be identified:
+*   The weekly and daily charts are ranging between well-defined levels.
+*   The H4 shows lower highs while the H1 prints higher lows.
+*   Any entry inside the range offers a poor risk/reward ratio.
+*   Waiting for a breakout and retest is the better plan.
+"""
+
+# Share of the model latency until the first token of a streamed response
+STREAM_FIRST_TOKEN_SHARE = 0.2
+
+SUMMARY_RESPONSE = {
+    "direction": "Long",
+    "entry": 1.1,
+    "stop_loss": 1.095,
+    "take_profit": 1.11,
+    "rrr": 2,
+    "stop_loss_pips": 50,
+    "take_profit_pips": 100,
+}
+
+
+def make_png(width, height, seed=0):
+    # Noisy RGB image so the PNG does not compress to nothing
+    rng = random.Random(seed)
+    rows = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+
+    def chunk(kind, data):
+        return (
+            struct.pack(">I", len(data))
+            + kind
+            + data
+            + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+        )
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(rows, 1))
+        + chunk(b"IEND", b"")
+    )
+
+
+# --- OpenAI-compatible stub ---
+class StubSettings:
+    def __init__(self, args):
+        self.model_latency = args.model_latency_ms / 1000
+        self.summary_latency = args.summary_latency_ms / 1000
+        self.jitter = args.latency_jitter
+        self.error_rate = args.error_rate
+        self.freeform_rate = args.freeform_rate
+        self.no_setup_rate = args.no_setup_rate
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings = None
+    summary_system_prompt = None
+    batch_summary_system_prompt = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, request, content, duration, usage):
+        # Server-sent events with one line of the content per chunk, the client
+        # may hang up in between
+        lines = content.splitlines(keepends=True)
+        base = {
+            "id": f"bench-{self.settings.requests}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "bench"),
+        }
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for index, line in enumerate(lines):
+                if index:
+                    time.sleep(duration / len(lines))
+                choice = {"index": 0, "delta": {"content": line}, "finish_reason": None}
+                self.write_event({**base, "choices": [choice]})
+            choice = {"index": 0, "delta": {}, "finish_reason": "stop"}
+            self.write_event({**base, "choices": [choice]})
+            self.write_event({**base, "choices": [], "usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def write_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        settings = self.settings
+
+        messages = request.get("messages", [])
+        system_prompt = messages[0].get("content") if messages else None
+        is_batch = system_prompt == self.batch_summary_system_prompt
+        is_summary = is_batch or system_prompt == self.summary_system_prompt
+        latency = settings.summary_latency if is_summary else settings.model_latency
+        latency = max(
+            0.0, latency * random.uniform(1 - settings.jitter, 1 + settings.jitter)
+        )
+        # A stream sends its first token early and the rest line by line
+        stream = request.get("stream") and not is_summary
+        time.sleep(latency * STREAM_FIRST_TOKEN_SHARE if stream else latency)
+
+        with settings.lock:
+            settings.requests += 1
+            failed = random.random() < settings.error_rate
+            settings.errors += failed
+        if failed:
+            status = random.choice([429, 500, 503])
+            self.send_json(
+                status,
+                {"error": {"message": "benchmark error", "code": status}},
+                {"Retry-After": "0"},
+            )
+            return
+
+        entry = round(random.uniform(1.05, 1.15), 4)
+        prices = {
+            "instrument": "BENCH",
+            "entry": entry,
+            "stop_loss": entry - 0.005,
+            "take_profit": entry + 0.01,
+        }
+        if is_batch:
+            filenames = re.findall(r"^### (.+)$", messages[1]["content"], re.MULTILINE)
+            content = json.dumps(
+                [{"filename": name, **SUMMARY_RESPONSE} for name in filenames]
+            )
+        elif is_summary:
+            content = json.dumps(SUMMARY_RESPONSE)
+        else:
+            draw = random.random()
+            if draw < settings.no_setup_rate:
+                content = NO_SETUP_RESPONSE.format(**prices)
+            elif draw < settings.no_setup_rate + settings.freeform_rate:
+                content = FREEFORM_RESPONSE.format(**prices)
+            else:
+                content = SETUP_RESPONSE.format(**prices)
+
+        prompt_tokens = length // 4
+        completion_tokens = len(content) // 4
+        if stream:
+            self.send_stream(
+                request,
+                content,
+                latency * (1 - STREAM_FIRST_TOKEN_SHARE),
+                {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "cost": 0.0,
+                },
+            )
+            return
+        self.send_json(
+            200,
+            {
+                "id": f"bench-{settings.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "bench"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "cost": 0.0,
+                },
+            },
+        )
+
+
+def start_stub_server(
+    settings, summary_system_prompt, batch_summary_system_prompt=None
+):
+    handler = type(
+        "BenchmarkStubHandler",
+        (StubHandler,),
+        {
+            "settings": settings,
+            "summary_system_prompt": summary_system_prompt,
+            "batch_summary_system_prompt": batch_summary_system_prompt,
+        },
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --- Fake TradingView page ---
+class FakeDownload:
+    def __init__(self, filename, data):
+        self.suggested_filename = filename
+        self.data = data
+
+    def save_as(self, path):
+        with open(path, "wb") as file:
+            file.write(self.data)
+
+
+class FakeDownloadInfo:
+    value = None
+
+
+class FakeLocator:
+    def __init__(self, page):
+        self.page = page
+
+    @property
+    def first(self):
+        return self
+
+    def screenshot(self, type="png"):
+        return self.page.render_image()
+
+    def bounding_box(self):
+        return {"x": 0, "y": 0, "width": self.page.width, "height": self.page.height}
+
+
+class FakeCDPSession:
+    def __init__(self, page):
+        self.page = page
+
+    def send(self, method, params=None):
+        if method == "Page.captureScreenshot":
+            return {"data": base64.b64encode(self.page.render_image()).decode("ascii")}
+        return {}
+
+    def detach(self):
+        pass
+
+
+class FakeContext:
+    def __init__(self, page):
+        self.page = page
+
+    def new_cdp_session(self, page):
+        return FakeCDPSession(page)
+
+
+class FakePage:
+    # Emulates the keyboard driven symbol/timeframe switching: a change typed
+    # and confirmed with Enter shows up after the render delay, while it renders
+    # the DOM mutation counter keeps climbing like a loading chart
+    def __init__(self, render_delay, jitter, width, height):
+        self.render_delay = render_delay
+        self.jitter = jitter
+        self.width = width
+        self.height = height
+        self.context = FakeContext(self)
+        self.keyboard = self
+        self.buffer = ""
+        self.symbol = ""
+        self.interval = ""
+        self.pending = {}
+        self.rendered_at = 0.0
+        self.mutations = 0
+        self.images = 0
+
+    # Page API
+    def set_default_timeout(self, timeout):
+        pass
+
+    def on(self, event, handler):
+        pass
+
+    def goto(self, url):
+        time.sleep(self.render_delay)
+
+    def close(self):
+        pass
+
+    def wait_for_timeout(self, timeout):
+        time.sleep(timeout / 1000)
+
+    def evaluate(self, script, args=None):
+        rendering = time.perf_counter() < self.rendered_at
+        self.mutations += 100 if rendering else 1
+        if not rendering:
+            self.apply_pending()
+        return {
+            "mutations": self.mutations,
+            "symbol": self.symbol,
+            "interval": self.interval,
+        }
+
+    def apply_pending(self):
+        for name, value in self.pending.items():
+            setattr(self, name, value)
+        self.pending = {}
+
+    def locator(self, selector):
+        return FakeLocator(self)
+
+    @contextmanager
+    def expect_download(self):
+        info = FakeDownloadInfo()
+        yield info
+        self.images += 1
+        info.value = FakeDownload(
+            f"{self.symbol}_{self.interval}_{self.images}.png", self.render_image()
+        )
+
+    # Keyboard API
+    def type(self, text):
+        self.buffer += text
+
+    def press(self, key):
+        if key != "Enter":
+            return
+        text, self.buffer = self.buffer, ""
+        if ":" in text:
+            self.pending["symbol"] = text.split(":")[1]
+        else:
+            self.pending["interval"] = text
+        delay = self.render_delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+        self.rendered_at = time.perf_counter() + delay
+
+    def render_image(self):
+        time.sleep(max(0.0, self.rendered_at - time.perf_counter()))
+        self.apply_pending()
+        return make_png(self.width, self.height, seed=self.images)
+
+
+# --- Harness ---
+def configure_environment(args, work_directory, stub_url):
+    symbols = [
+        (
+            f"FX:{BENCHMARK_SYMBOLS[index]}"
+            if index < len(BENCHMARK_SYMBOLS)
+            else f"FX:BENCH{index}"
+        )
+        for index in range(args.symbols)
+    ]
+    os.environ.update(
+        {
+            "ENDPOINT_URL": "http://127.0.0.1:0",
+            "WEBSITE_URL": "about:blank",
+            "TF_RELOAD_TIMEOUT": str(args.tf_reload_timeout),
+            "CHART_RELOAD_TIMEOUT": str(args.chart_reload_timeout),
+            "TIMEFRAMES": json.dumps(BENCHMARK_TIMEFRAMES[: args.timeframes]),
+            "SYMBOLS": json.dumps(symbols),
+            "OPENROUTER_API_KEY": "benchmark",
+            "OPENROUTER_BASE_URL": stub_url,
+            "OPENROUTER_MODELS": json.dumps(
+                [f"bench/model-{index}" for index in range(args.models)]
+            ),
+            "SUMMARY_MODEL": "bench/summary",
+            "DOWNLOAD_DIRECTORY": os.path.join(work_directory, "downloads"),
+            "LLM_CACHE_DIRECTORY": os.path.join(work_directory, "llm_cache"),
+            "LLM_CACHE_BYPASS": "True",
+            "RUN_REPORT_DIRECTORY": os.path.join(work_directory, "run_reports"),
+            "RESULTS_DB": os.path.join(work_directory, "results.sqlite3"),
+        }
+    )
+    # Settings given on the command line win over the defaults above
+    for setting in args.env:
+        name, _, value = setting.partition("=")
+        os.environ[name] = value
+
+
+def get_peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def make_fake_page_factory(args):
+    @contextmanager
+    def open_fake_page():
+        page = FakePage(
+            args.render_delay_ms / 1000,
+            args.latency_jitter,
+            args.image_width,
+            args.image_height,
+        )
+        page.goto("about:blank")
+        yield page
+
+    return open_fake_page
+
+
+def run_full(main_module):
+    start = time.perf_counter()
+    main_module.main()
+    return time.perf_counter() - start
+
+
+def run_stages(main_module, args):
+    # Each stage function on its own, one symbol after the other
+    timings = {}
+    summaries = {}
+    page_factory = make_fake_page_factory(args)
+
+    main_module.clear_download_directory()
+    start = time.perf_counter()
+    images = {}
+    with page_factory() as page:
+        for symbol in main_module.symbols:
+            images[symbol] = main_module.take_screenshots_for_symbol(symbol, page)
+    timings["capture"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for symbol in main_module.symbols:
+        main_module.generate_setups_for_symbol(symbol, images[symbol])
+    timings["analyze"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for symbol in main_module.symbols:
+        summaries[symbol] = main_module.summarize_setups_for_symbol(symbol)
+    timings["summarize"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for symbol in main_module.symbols:
+        main_module.save_summaries_to_excel_for_symbol(symbol, summaries[symbol])
+    timings["report"] = time.perf_counter() - start
+
+    return timings
+
+
+def run_benchmark(args):
+    work_directory = tempfile.mkdtemp(prefix="tv-ai-benchmark-")
+
+    from llm_prompts import BATCH_SUMMARY_SYSTEM_PROMPT, SUMMARY_SYSTEM_PROMPT
+
+    settings = StubSettings(args)
+    server = start_stub_server(
+        settings, SUMMARY_SYSTEM_PROMPT, BATCH_SUMMARY_SYSTEM_PROMPT
+    )
+    stub_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    configure_environment(args, work_directory, stub_url)
+
+    # The configuration is read on import, so main is imported after the
+    # environment points to the fakes
+    import instrumentation
+    import main as main_module
+
+    main_module.open_tradingview_page = make_fake_page_factory(args)
+
+    results = {
+        "started": datetime.now().isoformat(),
+        "parameters": {
+            "symbols": args.symbols,
+            "models": args.models,
+            "timeframes": args.timeframes,
+            "render_delay_ms": args.render_delay_ms,
+            "model_latency_ms": args.model_latency_ms,
+            "summary_latency_ms": args.summary_latency_ms,
+            "error_rate": args.error_rate,
+            "freeform_rate": args.freeform_rate,
+            "no_setup_rate": args.no_setup_rate,
+            "env": args.env,
+        },
+        "work_directory": work_directory,
+    }
+
+    if args.mode in ("full", "all"):
+        wall_seconds = run_full(main_module)
+        report = instrumentation.build_run_report(main_module.get_run_counters())
+        results["full"] = {
+            "wall_seconds": round(wall_seconds, 3),
+            "symbols_per_minute": round(args.symbols / wall_seconds * 60, 2),
+            "model_calls_per_second": round(
+                args.symbols * args.models / wall_seconds, 2
+            ),
+            "stages": report["stages"],
+            "counters": report["counters"],
+        }
+
+    if args.mode in ("stages", "all"):
+        instrumentation.start_run()
+        timings = run_stages(main_module, args)
+        results["stages"] = {
+            stage: round(seconds, 3) for stage, seconds in timings.items()
+        }
+
+    results["stub_requests"] = settings.requests
+    results["stub_errors"] = settings.errors
+    results["peak_rss_mb"] = round(get_peak_rss_mb(), 1)
+    server.shutdown()
+    return results
+
+
+def print_results(results):
+    print()
+    print("Benchmark results")
+    print(f"  parameters: {json.dumps(results['parameters'])}")
+    if "full" in results:
+        full = results["full"]
+        print(
+            f"  full run: {full['wall_seconds']:.2f} s wall, "
+            f"{full['symbols_per_minute']:.1f} symbols/min, "
+            f"{full['model_calls_per_second']:.2f} model calls/s"
+        )
+        for stage, stats in full["stages"].items():
+            print(
+                f"    {stage:<14} {stats['count']:>5}x  p50 {stats['p50']:>7.3f} s  "
+                f"p95 {stats['p95']:>7.3f} s  total {stats['total_seconds']:>8.2f} s"
+            )
+    if "stages" in results:
+        print("  stage functions on their own:")
+        for stage, seconds in results["stages"].items():
+            print(f"    {stage:<14} {seconds:>8.2f} s")
+    print(
+        f"  stub: {results['stub_requests']} requests, {results['stub_errors']} errors"
+    )
+    print(f"  peak RSS: {results['peak_rss_mb']:.1f} MB")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Offline benchmark with a fake browser page and a local OpenAI stub"
+    )
+    parser.add_argument("--mode", choices=["full", "stages", "all"], default="all")
+    parser.add_argument("--symbols", type=int, default=6)
+    parser.add_argument("--models", type=int, default=4)
+    parser.add_argument(
+        "--timeframes",
+        type=int,
+        default=3,
+        choices=range(1, len(BENCHMARK_TIMEFRAMES) + 1),
+    )
+    parser.add_argument("--render-delay-ms", type=int, default=300)
+    parser.add_argument("--model-latency-ms", type=int, default=2000)
+    parser.add_argument("--summary-latency-ms", type=int, default=500)
+    parser.add_argument("--latency-jitter", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--freeform-rate",
+        type=float,
+        default=0.1,
+        help="Share of setups not in the expected format (needs the summary model)",
+    )
+    parser.add_argument(
+        "--no-setup-rate",
+        type=float,
+        default=0.0,
+        help="Share of setups answered with a no-setup verdict",
+    )
+    parser.add_argument("--image-width", type=int, default=800)
+    parser.add_argument("--image-height", type=int, default=450)
+    parser.add_argument("--tf-reload-timeout", type=int, default=2000)
+    parser.add_argument("--chart-reload-timeout", type=int, default=5000)
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Extra setting, e.g. --env READINESS_MODE=fixed",
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmark(args)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import base64
+import os
+from datetime import datetime
+
+from decouple import config
+from werkzeug.utils import secure_filename
+
+# "download" saves TradingView's own screenshot (Control+Alt+S) to disk,
+# "element" and "cdp" grab the chart element in memory
+capture_mode = config("CAPTURE_MODE", default="download").lower()
+chart_selector = config("CHART_SELECTOR", default=".chart-container")
+# Keep a copy of in-memory captures in the symbol directory
+persist_screenshots = config("PERSIST_SCREENSHOTS", default=True, cast=bool)
+
+CAPTURE_MODES = ("download", "element", "cdp")
+
+
+def in_memory_capture():
+    if capture_mode not in CAPTURE_MODES:
+        raise ValueError(f"Unsupported CAPTURE_MODE: {capture_mode}")
+    return capture_mode != "download"
+
+
+def get_capture_filename(symbol_name, timeframe):
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return secure_filename(f"{symbol_name}_{timeframe}_{timestamp}.png")
+
+
+def download_chart_screenshot(page, download_directory):
+    with page.expect_download() as download_info:
+        page.keyboard.press("Control+Alt+S")
+
+    download = download_info.value
+
+    # Wait for the download process to complete and save the downloaded file in specified path
+    path = os.path.join(download_directory, download.suggested_filename)
+    download.save_as(path)
+    return path
+
+
+def capture_chart_bytes(page):
+    chart = page.locator(chart_selector).first
+    if capture_mode == "element":
+        return chart.screenshot(type="png")
+
+    # Clip to the chart element with the DevTools protocol, which skips
+    # Playwright's scrolling and stability checks of element screenshots
+    box = chart.bounding_box()
+    if box is None:
+        raise RuntimeError(f"Chart element {chart_selector} is not visible")
+    session = page.context.new_cdp_session(page)
+    try:
+        result = session.send(
+            "Page.captureScreenshot",
+            {"format": "png", "clip": {**box, "scale": 1}},
+        )
+    finally:
+        session.detach()
+    return base64.b64decode(result["data"])
+
+
+def capture_chart_image(page, symbol_name, timeframe, download_directory, persist=None):
+    # Returns (filename, png bytes) for the in-memory modes
+    filename = get_capture_filename(symbol_name, timeframe)
+    data = capture_chart_bytes(page)
+    if persist_screenshots if persist is None else persist:
+        with open(os.path.join(download_directory, filename), "wb") as file:
+            file.write(data)
+    return filename, data
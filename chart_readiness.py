@@ -0,0 +1,218 @@
+import time
+
+from decouple import config
+
+from helper_func import print_status
+from instrumentation import Counters
+
+# "event" waits for the chart to settle with the configured timeouts as upper
+# bound, "fixed" always sleeps the full TF_RELOAD_TIMEOUT/CHART_RELOAD_TIMEOUT
+readiness_mode = config("READINESS_MODE", default="event").lower()
+readiness_poll_ms = int(config("READINESS_POLL_MS", default=100))
+readiness_quiet_ms = int(config("READINESS_QUIET_MS", default=400))
+# Live ticks keep arriving on a loaded chart, activity up to these limits per
+# poll still counts as quiet
+readiness_max_mutations = int(config("READINESS_MAX_MUTATIONS", default=25))
+readiness_max_feed_bytes = int(config("READINESS_MAX_FEED_BYTES", default=4096))
+symbol_label_selector = config(
+    "SYMBOL_LABEL_SELECTOR", default="#header-toolbar-symbol-search"
+)
+interval_label_selector = config(
+    "INTERVAL_LABEL_SELECTOR",
+    default='#header-toolbar-intervals button[aria-checked="true"]',
+)
+
+HISTOGRAM_BUCKETS = [0.25, 0.5, 1, 2, 3, 5, 10]
+
+# Counts DOM mutations and reads the symbol/interval labels of the chart header
+READINESS_SCRIPT = """
+([symbolSelector, intervalSelector]) => {
+    if (!window.__chartReadiness) {
+        window.__chartReadiness = { mutations: 0 };
+        new MutationObserver((records) => {
+            window.__chartReadiness.mutations += records.length;
+        }).observe(document.body, {
+            subtree: true,
+            childList: true,
+            characterData: true,
+            attributes: true,
+        });
+    }
+    const text = (selector) => {
+        const element = selector ? document.querySelector(selector) : null;
+        return element ? element.textContent : null;
+    };
+    return {
+        mutations: window.__chartReadiness.mutations,
+        symbol: text(symbolSelector),
+        interval: text(intervalSelector),
+    };
+}
+"""
+
+# Timeouts and samples of the wait times per kind of wait
+wait_stats = Counters()
+
+_monitors = {}
+
+
+class DataFeedMonitor:
+    # Tracks websocket traffic (TradingView's data feed) and HTTP requests of a page
+    def __init__(self, page):
+        self.feed_bytes = 0
+        self.pending_requests = set()
+        page.on("websocket", self.on_websocket)
+        page.on("request", self.on_request)
+        page.on("requestfinished", self.on_request_done)
+        page.on("requestfailed", self.on_request_done)
+
+    def on_websocket(self, websocket):
+        websocket.on("framereceived", self.on_frame)
+
+    def on_frame(self, payload):
+        self.feed_bytes += len(payload)
+
+    def on_request(self, request):
+        self.pending_requests.add(request)
+
+    def on_request_done(self, request):
+        self.pending_requests.discard(request)
+
+
+def attach_readiness_monitor(page):
+    # Attach before page.goto so the data feed websocket is observed from the start
+    monitor = _monitors.get(id(page))
+    if monitor is None:
+        monitor = DataFeedMonitor(page)
+        _monitors[id(page)] = monitor
+    return monitor
+
+
+def detach_readiness_monitor(page):
+    _monitors.pop(id(page), None)
+
+
+def normalize_label(text):
+    return "".join(text.split()).lower()
+
+
+def label_matches(label, expected):
+    # Labels that cannot be found are not used as a signal
+    if label is None or not expected:
+        return True
+    # The whole label must match, "15" or "EURUSD" inside a longer label is
+    # still the previous chart
+    return normalize_label(label) in label_variants(normalize_label(expected))
+
+
+def label_variants(expected):
+    # TradingView shows "1D" as "D", "1W" as "W" etc. and minutes typed as
+    # "15" or "240" as "15m" or "4h"
+    variants = {expected}
+    if len(expected) == 2 and expected[0] == "1" and expected[1] in "dwm":
+        variants.add(expected[1])
+    if expected.isdigit():
+        minutes = int(expected)
+        variants.add(f"{minutes}m")
+        if minutes % 60 == 0:
+            variants.add(f"{minutes // 60}h")
+    return variants
+
+
+def record_wait(kind, seconds, timed_out):
+    wait_stats.add_sample(kind, seconds)
+    if timed_out:
+        wait_stats.count(kind)
+
+
+def wait_for_chart_ready(page, timeout_ms, kind, symbol=None, interval=None):
+    start = time.perf_counter()
+    if readiness_mode != "event":
+        page.wait_for_timeout(timeout_ms)
+        record_wait(kind, time.perf_counter() - start, False)
+        return
+
+    monitor = attach_readiness_monitor(page)
+    deadline = start + timeout_ms / 1000
+    # Requests that were already running (long polling etc.) are ignored
+    ignored_requests = set(monitor.pending_requests)
+    previous_mutations = None
+    previous_feed_bytes = monitor.feed_bytes
+    quiet_since = None
+
+    while True:
+        # Waiting inside Playwright lets it dispatch the page events
+        page.wait_for_timeout(readiness_poll_ms)
+        now = time.perf_counter()
+
+        try:
+            state = page.evaluate(
+                READINESS_SCRIPT, [symbol_label_selector, interval_label_selector]
+            )
+        except Exception:
+            # Page is navigating, try again on the next poll
+            state = None
+
+        settled = False
+        if state is not None:
+            mutations = state["mutations"]
+            mutation_delta = mutations - (previous_mutations or 0)
+            feed_delta = monitor.feed_bytes - previous_feed_bytes
+            previous_feed_bytes = monitor.feed_bytes
+
+            # The first poll only sets the baseline of the mutation counter
+            settled = (
+                previous_mutations is not None
+                and label_matches(state["symbol"], symbol)
+                and label_matches(state["interval"], interval)
+                and mutation_delta <= readiness_max_mutations
+                and feed_delta <= readiness_max_feed_bytes
+                and not (monitor.pending_requests - ignored_requests)
+            )
+            previous_mutations = mutations
+
+        quiet_since = (quiet_since or now) if settled else None
+        if quiet_since is not None and now - quiet_since >= readiness_quiet_ms / 1000:
+            record_wait(kind, now - start, False)
+            return
+
+        if now >= deadline:
+            record_wait(kind, now - start, True)
+            return
+
+
+def format_histogram(values):
+    counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+    for value in values:
+        for index, bucket in enumerate(HISTOGRAM_BUCKETS):
+            if value <= bucket:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = [f"<={bucket}s" for bucket in HISTOGRAM_BUCKETS] + [
+        f">{HISTOGRAM_BUCKETS[-1]}s"
+    ]
+    return " ".join(f"{label}:{count}" for label, count in zip(labels, counts) if count)
+
+
+def get_readiness_stats():
+    stats = {}
+    for kind, values in sorted(wait_stats.get_samples().items()):
+        stats[kind] = {
+            "waits": len(values),
+            "timeouts": wait_stats.get(kind, 0),
+            "p50": round(values[len(values) // 2], 3),
+            "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+            "histogram": format_histogram(values),
+        }
+    return stats
+
+
+def print_readiness_stats():
+    for kind, stats in get_readiness_stats().items():
+        print_status(
+            f"Chart wait '{kind}': {stats['waits']} waits, p50 {stats['p50']:.2f} s, "
+            f"p95 {stats['p95']:.2f} s, {stats['timeouts']} timeouts | "
+            f"{stats['histogram']}"
+        )
@@ -0,0 +1,132 @@
+import argparse
+import sys
+import time
+
+# Start of the command, the startup time reported with --timing covers the
+# project modules and libraries the command imports and its configuration
+started = time.perf_counter()
+
+from helper_func import (  # noqa: E402
+    clear_download_directory,
+    clear_symbol_directory,
+    print_status,
+)
+
+STAGE_COMMANDS = {
+    "capture": ["capture"],
+    "analyze": ["analyze"],
+    "summarize": ["summarize"],
+}
+
+
+def select_symbols(configured, selected):
+    # Symbols are given as in SYMBOLS or without the exchange, e.g. GBPUSD
+    if not selected:
+        return list(configured)
+    symbols = []
+    for name in selected:
+        matches = [
+            symbol
+            for symbol in configured
+            if name.upper() in (symbol.upper(), symbol.split(":")[1].upper())
+        ]
+        if matches:
+            symbols.extend(matches)
+        elif ":" in name:
+            symbols.append(name)
+        else:
+            raise ValueError(f"{name} is not in SYMBOLS, give it as EXCHANGE:SYMBOL")
+    return list(dict.fromkeys(symbols))
+
+
+def clear_previous_captures(symbols, selected):
+    # Same as a full run: everything goes, with a symbol filter only the
+    # directories of the selected symbols
+    if selected:
+        for symbol in symbols:
+            clear_symbol_directory(symbol)
+    else:
+        clear_download_directory()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the whole pipeline or a single stage of it."
+    )
+    filters = argparse.ArgumentParser(add_help=False)
+    filters.add_argument(
+        "--symbol",
+        action="append",
+        help="Only this symbol, e.g. GBPUSD or FX:GBPUSD (repeatable)",
+    )
+    filters.add_argument(
+        "--model", action="append", help="Only this model (repeatable)"
+    )
+    filters.add_argument(
+        "--timing", action="store_true", help="Print the startup and total time"
+    )
+
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser(
+        "capture", parents=[filters], help="Capture the chart screenshots"
+    )
+    commands.add_parser(
+        "analyze", parents=[filters], help="Ask the models for trading setups"
+    )
+    commands.add_parser(
+        "summarize", parents=[filters], help="Summarize the existing setups"
+    )
+    commands.add_parser(
+        "report",
+        parents=[filters],
+        help="Rebuild the Excel reports from the results store",
+    )
+    commands.add_parser(
+        "run", parents=[filters], help="Run the stages of PIPELINE_STAGES"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Heavy libraries (playwright, openai, openpyxl) are imported by the
+    # functions that use them, so e.g. a report never loads the browser client
+    import main as main_module
+    from llm_client import close_openai_clients
+
+    try:
+        symbols = select_symbols(main_module.symbols, args.symbol)
+    except ValueError as e:
+        print_status(str(e))
+        return 1
+    if not symbols:
+        print_status("No symbols given and SYMBOLS is not set")
+        return 1
+    models = args.model
+    if args.timing:
+        print_status(
+            f"Startup of '{args.command}': {time.perf_counter() - started:.3f} s"
+        )
+
+    if args.command == "report":
+        main_module.rebuild_reports(symbols, models)
+    else:
+        stages = STAGE_COMMANDS.get(args.command, main_module.pipeline_stages)
+        # Screenshots of a previous run are kept when they are reused
+        if "capture" in stages and not main_module.incremental_mode:
+            clear_previous_captures(symbols, args.symbol)
+        try:
+            main_module.run_pipeline(symbols, stages=stages, models=models)
+        finally:
+            close_openai_clients()
+
+    if args.timing:
+        print_status(
+            f"'{args.command}' finished in {time.perf_counter() - started:.3f} s"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
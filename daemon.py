@@ -0,0 +1,196 @@
+import json
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from decouple import config
+
+# The daemon only redoes the work of closed candles, which the manifest of the
+# incremental mode keeps track of
+os.environ.setdefault("INCREMENTAL_MODE", "True")
+
+import main  # noqa: E402
+from helper_func import print_status  # noqa: E402
+from manifest import expire_captures, incremental_mode, timeframe_seconds  # noqa: E402
+from pipeline import ResourcePool  # noqa: E402
+
+# Seconds to wait after a candle close so TradingView has drawn the new candle
+close_delay = float(config("DAEMON_CLOSE_DELAY", default=10))
+# Minutes after midnight UTC at which daily, weekly and monthly candles close
+daily_close_offset = int(config("DAILY_CLOSE_OFFSET_MINUTES", default=0)) * 60
+# Port of the health endpoint on localhost, 0 disables it
+health_port = int(config("DAEMON_HEALTH_PORT", default=8765))
+
+# 1970-01-01 was a Thursday, weekly candles start on Monday
+WEEK_ANCHOR = 4 * 86400
+
+status = {
+    "state": "starting",
+    "started": datetime.now().isoformat(timespec="seconds"),
+    "cycles": 0,
+    "failed_cycles": 0,
+    "last_cycle": None,
+    "next_cycle": None,
+}
+status_lock = threading.Lock()
+stop_event = threading.Event()
+
+
+def update_status(**changes):
+    with status_lock:
+        status.update(changes)
+
+
+def next_candle_close(timeframe, now):
+    # Epoch seconds of the first close of the timeframe after `now`
+    unit = timeframe.strip().upper()[-1:]
+    if unit == "M":
+        count = int(timeframe.strip()[:-1] or 1)
+        current = datetime.fromtimestamp(now - daily_close_offset, timezone.utc)
+        month = ((current.year * 12 + current.month - 1) // count + 1) * count
+        close = datetime(month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+        return close.timestamp() + daily_close_offset
+
+    seconds = timeframe_seconds(timeframe)
+    anchor = 0
+    if unit in ("D", "W"):
+        anchor = daily_close_offset
+    if unit == "W":
+        anchor += WEEK_ANCHOR
+    return anchor + ((now - anchor) // seconds + 1) * seconds
+
+
+def get_next_cycle(now):
+    # Returns (time of the next close, timeframes closing at that time)
+    closes = {
+        timeframe: next_candle_close(timeframe, now) for timeframe in main.timeframes
+    }
+    next_close = min(closes.values())
+    return next_close, [
+        timeframe for timeframe, close in closes.items() if close == next_close
+    ]
+
+
+def run_cycle(closed_timeframes, capture_pool):
+    # Only the captures of the closed timeframes are expired, the manifest
+    # decides which setups, summaries and reports have to be redone
+    for symbol in main.symbols:
+        expire_captures(symbol, closed_timeframes)
+
+    started = time.time()
+    update_status(state="running")
+    try:
+        report = main.run_pipeline(main.symbols, capture_pool)
+        ok = True
+    except Exception as e:
+        print_status(f"Daemon cycle failed: {e}")
+        report = {}
+        ok = False
+
+    with status_lock:
+        status["cycles"] += 1
+        status["failed_cycles"] += not ok
+        status["state"] = "idle"
+        status["last_cycle"] = {
+            "run_id": report.get("run_id"),
+            "ok": ok,
+            "timeframes": closed_timeframes,
+            "started": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+            "wall_seconds": round(time.time() - started, 3),
+        }
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    capture_pool = None
+
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/health", "/status"):
+            self.send_error(404)
+            return
+        with status_lock:
+            body = dict(status)
+        if self.capture_pool is not None:
+            body["open_pages"] = self.capture_pool.open_resources
+            body["capture_workers"] = self.capture_pool.workers
+        last_cycle = body["last_cycle"]
+        healthy = last_cycle is None or last_cycle["ok"]
+        payload = json.dumps(body, indent=2).encode("utf-8")
+        self.send_response(200 if healthy else 503)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_health_server(capture_pool):
+    if not health_port:
+        return None
+    HealthHandler.capture_pool = capture_pool
+    server = ThreadingHTTPServer(("127.0.0.1", health_port), HealthHandler)
+    threading.Thread(
+        target=server.serve_forever, name="daemon-health", daemon=True
+    ).start()
+    print_status(f"Health endpoint on http://127.0.0.1:{health_port}/health")
+    return server
+
+
+def stop(_signum=None, _frame=None):
+    stop_event.set()
+
+
+def run_daemon():
+    if not incremental_mode:
+        raise ValueError("The daemon needs INCREMENTAL_MODE=True")
+    if not main.symbols:
+        raise ValueError("SYMBOLS is not set")
+    print_status("Starting daemon...")
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Browser pages and the HTTP client stay open between the cycles
+    capture_pool = None
+    if "capture" in main.pipeline_stages:
+        capture_pool = ResourcePool(
+            main.open_tradingview_page,
+            workers=int(main.pipeline_workers.get("capture", 1)),
+            name="capture",
+        )
+    server = start_health_server(capture_pool)
+
+    # The first cycle catches up on whatever is stale from earlier runs
+    closed_timeframes = []
+    try:
+        while not stop_event.is_set():
+            run_cycle(closed_timeframes, capture_pool)
+
+            next_close, closed_timeframes = get_next_cycle(time.time())
+            run_at = next_close + close_delay
+            update_status(
+                next_cycle={
+                    "at": datetime.fromtimestamp(run_at).isoformat(timespec="seconds"),
+                    "timeframes": closed_timeframes,
+                }
+            )
+            print_status(
+                f"Next cycle for {', '.join(closed_timeframes)} at "
+                f"{datetime.fromtimestamp(run_at):%Y-%m-%d %H:%M:%S}"
+            )
+            stop_event.wait(max(0.0, run_at - time.time()))
+    finally:
+        update_status(state="stopping")
+        if server is not None:
+            server.shutdown()
+        if capture_pool is not None:
+            capture_pool.close()
+        main.close_openai_clients()
+        print_status("Daemon stopped")
+
+
+if __name__ == "__main__":
+    run_daemon()
@@ -0,0 +1,190 @@
+import json
+import os
+import tempfile
+import threading
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+SUMMARY_COLUMNS = [
+    ("Filename", "filename"),
+    ("Direction", "direction"),
+    ("Entry", "entry"),
+    ("Stop Loss", "stop_loss"),
+    ("Take Profit", "take_profit"),
+    ("RRR", "rrr"),
+    ("Stop Loss Pips", "stop_loss_pips"),
+    ("Take Profit Pips", "take_profit_pips"),
+]
+CONSENSUS_HEADERS = [
+    "Symbol",
+    "Setups",
+    "Long",
+    "Short",
+    "No Setup",
+    "Consensus",
+    "Avg Entry",
+    "Avg Stop Loss",
+    "Avg Take Profit",
+    "Avg RRR",
+]
+TRADE_DIRECTIONS = ("Long", "Short")
+
+# One font object shared by every bold cell of a workbook
+BOLD_FONT = Font(bold=True)
+
+
+class ColumnWidths:
+    # Widths are tracked while rows are added, so no cell is scanned twice
+    def __init__(self, headers):
+        self.widths = [len(str(header)) for header in headers]
+
+    def update(self, row):
+        for index, value in enumerate(row):
+            if value is not None and value != "":
+                self.widths[index] = max(self.widths[index], len(str(value)))
+
+    def apply(self, sheet):
+        for index, width in enumerate(self.widths, start=1):
+            sheet.column_dimensions[get_column_letter(index)].width = width + 2
+
+
+def write_sheet(workbook, title, headers, rows, widths):
+    # Write-only sheets need their column widths before the first row
+    sheet = workbook.create_sheet(title=title)
+    widths.apply(sheet)
+    sheet.append([bold_cell(sheet, header) for header in headers])
+    for row in rows:
+        sheet.append([bold_cell(sheet, row[0]), *row[1:]])
+
+
+def bold_cell(sheet, value):
+    cell = WriteOnlyCell(sheet, value=value)
+    cell.font = BOLD_FONT
+    return cell
+
+
+def save_workbook(workbook, save_path):
+    # Saved next to the target first so readers never see a partial file
+    temp_path = f"{save_path}.tmp"
+    workbook.save(temp_path)
+    os.replace(temp_path, save_path)
+
+
+def summary_row(summary):
+    return [summary.get(key) for _header, key in SUMMARY_COLUMNS]
+
+
+def write_summaries_workbook(save_path, sheets):
+    # sheets maps a sheet title (the symbol) to its list of summaries
+    workbook = Workbook(write_only=True)
+    headers = [header for header, _key in SUMMARY_COLUMNS]
+    for title, summaries in sheets.items():
+        rows = [summary_row(summary) for summary in summaries]
+        widths = ColumnWidths(headers)
+        for row in rows:
+            widths.update(row)
+        write_sheet(workbook, title, headers, rows, widths)
+    save_workbook(workbook, save_path)
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def average(values):
+    values = [value for value in values if value is not None]
+    return round(sum(values) / len(values), 5) if values else None
+
+
+def consensus_row(symbol, summaries):
+    directions = [str(summary.get("direction")) for summary in summaries]
+    counts = {direction: directions.count(direction) for direction in TRADE_DIRECTIONS}
+    no_setup = len(directions) - sum(counts.values())
+
+    unique_directions = set(directions)
+    if len(unique_directions) == 1 and unique_directions <= set(TRADE_DIRECTIONS):
+        consensus = directions[0]
+    elif unique_directions & set(TRADE_DIRECTIONS):
+        consensus = "Mixed"
+    else:
+        consensus = "No Setup"
+
+    # Levels are only averaged when the models agree on the direction
+    agreeing = summaries if consensus in TRADE_DIRECTIONS else []
+    return [
+        symbol,
+        len(summaries),
+        counts["Long"],
+        counts["Short"],
+        no_setup,
+        consensus,
+        *(
+            average(to_float(summary.get(key)) for summary in agreeing)
+            for key in ("entry", "stop_loss", "take_profit", "rrr")
+        ),
+    ]
+
+
+class ConsolidatedReport:
+    # Streams every symbol into one workbook: rows are spooled to temporary
+    # files while the column widths are tracked, the write-only workbook is
+    # produced on close, so memory does not grow with the number of symbols
+    def __init__(self, save_path):
+        self.save_path = save_path
+        self.setup_headers = ["Symbol"] + [header for header, _key in SUMMARY_COLUMNS]
+        self.setups = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self.consensus = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self.setup_widths = ColumnWidths(self.setup_headers)
+        self.consensus_widths = ColumnWidths(CONSENSUS_HEADERS)
+        self.symbols = 0
+        self._lock = threading.Lock()
+
+    def add_symbol(self, symbol, summaries):
+        # Symbols whose models disagree are included and marked as "Mixed"
+        rows = [[symbol, *summary_row(summary)] for summary in summaries]
+        consensus = consensus_row(symbol, summaries)
+        with self._lock:
+            for row in rows:
+                self.setup_widths.update(row)
+                self.setups.write(json.dumps(row, default=str) + "\n")
+            self.consensus_widths.update(consensus)
+            self.consensus.write(json.dumps(consensus, default=str) + "\n")
+            self.symbols += 1
+
+    def close(self):
+        with self._lock:
+            try:
+                if not self.symbols:
+                    return None
+                workbook = Workbook(write_only=True)
+                write_sheet(
+                    workbook,
+                    "Consensus",
+                    CONSENSUS_HEADERS,
+                    read_rows(self.consensus),
+                    self.consensus_widths,
+                )
+                write_sheet(
+                    workbook,
+                    "Setups",
+                    self.setup_headers,
+                    read_rows(self.setups),
+                    self.setup_widths,
+                )
+                save_workbook(workbook, self.save_path)
+                return self.save_path
+            finally:
+                self.setups.close()
+                self.consensus.close()
+
+
+def read_rows(spool):
+    spool.seek(0)
+    for line in spool:
+        yield json.loads(line)
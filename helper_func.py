@@ -1,3 +1,5 @@
+import hashlib
+import math
 import os
 import shutil
 
@@ -7,6 +9,26 @@ from tqdm import tqdm
 from werkzeug.utils import secure_filename
 
 
+def now_iso():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def to_number(value):
+    # Summaries from the LLM sometimes carry numbers as strings
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value if math.isfinite(value) else None
+    try:
+        return float(str(value).replace(",", ""))
+    except ValueError:
+        return None
+
+
 def print_status(status):
     now = datetime.now()
     timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
@@ -41,6 +63,17 @@ def get_trading_setups_directory(symbol):
     return trading_setup_dir
 
 
+def get_setup_name(file_name):
+    return secure_filename(file_name)
+
+
+def get_trading_setup_path(symbol, file_name):
+    trading_setups_dir = get_trading_setups_directory(symbol)
+
+    safe_file_name = get_setup_name(file_name)
+    return os.path.join(trading_setups_dir, safe_file_name + ".txt")
+
+
 def save_trading_setup_to_file(symbol, trading_setup, file_name):
     if trading_setup is None or not trading_setup.strip():
         print_status(
@@ -48,10 +81,7 @@ def save_trading_setup_to_file(symbol, trading_setup, file_name):
         )
         return
 
-    trading_setups_dir = get_trading_setups_directory(symbol)
-
-    safe_file_name = secure_filename(file_name)
-    file_path = os.path.join(trading_setups_dir, safe_file_name + ".txt")
+    file_path = get_trading_setup_path(symbol, file_name)
     with open(file_path, "w", encoding="utf-8") as file:
         file.write(trading_setup)
 
@@ -73,3 +103,12 @@ def clear_download_directory():
                 shutil.rmtree(file_path)
         except Exception as e:
             print_status("Failed to delete %s. Reason: %s" % (file_path, e))
+
+
+def clear_symbol_directory(symbol):
+    # Delete the screenshots and trading setups of a single symbol
+    symbol_dir = get_symbol_directory(symbol)
+    try:
+        shutil.rmtree(symbol_dir)
+    except Exception as e:
+        print_status("Failed to delete %s. Reason: %s" % (symbol_dir, e))
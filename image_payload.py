@@ -0,0 +1,187 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+import time
+from functools import cache
+
+from decouple import config
+
+from helper_func import print_status
+from instrumentation import Counters
+
+# Image preparation: longest edge in pixels (0 keeps the original size),
+# output format (png, jpeg or webp) and quality for the lossy formats
+image_max_edge = int(config("IMAGE_MAX_EDGE", default=0))
+image_format = config("IMAGE_FORMAT", default="png").lower()
+image_quality = int(config("IMAGE_QUALITY", default=85))
+
+MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "jpg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+payload_stats = Counters("images", "original_bytes", "prepared_bytes", "encode_seconds")
+
+_payload_cache = {}
+_payload_cache_lock = threading.Lock()
+_pillow_warning_shown = False
+
+
+class PreparedImage:
+    def __init__(self, name, mime_type, data, original_size, encode_seconds):
+        self.name = name
+        self.mime_type = mime_type
+        self.data = data
+        self.original_size = original_size
+        self.encode_seconds = encode_seconds
+        encoded = base64.b64encode(data).decode("ascii")
+        self.data_url = f"data:{mime_type};base64,{encoded}"
+
+    @property
+    def bytes_saved(self):
+        return self.original_size - len(self.data)
+
+
+class SymbolPayload:
+    def __init__(self, images):
+        self.images = images
+
+        # Digest of the bytes sent to the models, identifies the payload content
+        digest = hashlib.sha256()
+        for image in images:
+            digest.update(image.data)
+        self.digest = digest.hexdigest()
+
+
+@cache
+def get_pillow_image():
+    # Pillow is only needed when screenshots are resized or re-encoded, it is
+    # imported by the first image that is
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def recompression_enabled():
+    return image_max_edge > 0 or image_format != "png"
+
+
+def recompress_image(data):
+    output_format = "jpeg" if image_format == "jpg" else image_format
+    if output_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported IMAGE_FORMAT: {image_format}")
+
+    Image = get_pillow_image()
+    with Image.open(io.BytesIO(data)) as image:
+        resized = bool(image_max_edge) and max(image.size) > image_max_edge
+        if resized:
+            image.thumbnail((image_max_edge, image_max_edge), Image.LANCZOS)
+        if output_format == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        if output_format == "png":
+            options = {"optimize": True}
+        else:
+            options = {"quality": image_quality}
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=output_format.upper(), **options)
+
+    prepared = buffer.getvalue()
+    # Re-encoding a full size chart can make it bigger, keep the original then
+    if not resized and len(prepared) >= len(data):
+        return data, "image/png"
+    return prepared, MIME_TYPES[output_format]
+
+
+def prepare_image(name, data):
+    global _pillow_warning_shown
+
+    start = time.perf_counter()
+    prepared, mime_type = data, "image/png"
+    if recompression_enabled():
+        if get_pillow_image() is None:
+            if not _pillow_warning_shown:
+                print_status(
+                    "Warning: Pillow is not installed, sending screenshots unchanged"
+                )
+                _pillow_warning_shown = True
+        else:
+            prepared, mime_type = recompress_image(data)
+
+    image = PreparedImage(
+        name, mime_type, prepared, len(data), time.perf_counter() - start
+    )
+
+    payload_stats.count("images")
+    payload_stats.count("original_bytes", image.original_size)
+    payload_stats.count("prepared_bytes", len(image.data))
+    payload_stats.count("encode_seconds", image.encode_seconds)
+
+    print_status(
+        f"Prepared {name}: {image.original_size / 1024:.0f} KB -> "
+        f"{len(image.data) / 1024:.0f} KB ({image.bytes_saved / 1024:.0f} KB saved) "
+        f"in {image.encode_seconds * 1000:.0f} ms"
+    )
+    return image
+
+
+def get_symbol_payload(symbol, screenshot_files):
+    # Each screenshot is read and encoded once per symbol, all model requests
+    # share the resulting payload
+    files = sorted(screenshot_files)
+    key = tuple((path, os.path.getmtime(path), os.path.getsize(path)) for path in files)
+
+    with _payload_cache_lock:
+        cached = _payload_cache.get(symbol)
+        if cached and cached[0] == key:
+            return cached[1]
+
+    images = []
+    for path in files:
+        try:
+            with open(path, "rb") as file:
+                images.append((os.path.basename(path), file.read()))
+        except Exception as e:
+            print_status(f"Error processing image {path}: {e}")
+            continue
+
+    return store_symbol_payload(symbol, key, images)
+
+
+def get_symbol_payload_from_images(symbol, images):
+    # In-memory captures as (filename, bytes), nothing is read from disk
+    key = tuple((name, hashlib.sha256(data).hexdigest()) for name, data in images)
+
+    with _payload_cache_lock:
+        cached = _payload_cache.get(symbol)
+        if cached and cached[0] == key:
+            return cached[1]
+
+    return store_symbol_payload(symbol, key, images)
+
+
+def store_symbol_payload(symbol, key, images):
+    prepared = []
+    for name, data in images:
+        try:
+            prepared.append(prepare_image(name, data))
+        except Exception as e:
+            print_status(f"Error processing image {name}: {e}")
+            continue
+
+    payload = SymbolPayload(prepared)
+    with _payload_cache_lock:
+        _payload_cache[symbol] = (key, payload)
+    return payload
+
+
+def release_symbol_payload(symbol):
+    with _payload_cache_lock:
+        _payload_cache.pop(symbol, None)
@@ -0,0 +1,290 @@
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from decouple import config
+
+from helper_func import check_if_directory_exists, print_status
+
+# Run reports: directory of the JSON reports and path of the Prometheus
+# textfile (empty disables it), e.g. for node_exporter's textfile collector
+run_report_directory = config("RUN_REPORT_DIRECTORY", default="run_reports")
+metrics_textfile = config(
+    "METRICS_TEXTFILE", default=os.path.join(run_report_directory, "metrics.prom")
+)
+
+METRIC_PREFIX = "tv_ai"
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+run_id = uuid.uuid4().hex[:12]
+run_started = time.time()
+spans = []
+usage_totals = defaultdict(lambda: defaultdict(float))
+
+# Functions resetting the counters of other modules when a run starts
+run_start_hooks = []
+
+_lock = threading.Lock()
+
+
+def reset_on_run_start(hook):
+    # Decorator, the counters of every run report cover that run only
+    run_start_hooks.append(hook)
+    return hook
+
+
+class Counters(dict):
+    # Counters of a module, e.g. cache hits, and lists of samples per key,
+    # e.g. latencies per model, both reset when a run starts
+    def __init__(self, *names):
+        super().__init__((name, 0) for name in names)
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+        reset_on_run_start(self.reset)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self[name] = self.get(name, 0) + amount
+
+    def add_sample(self, key, value):
+        with self.lock:
+            self.samples[key].append(value)
+
+    def get_samples(self):
+        # Sorted copies of the samples per key
+        with self.lock:
+            return {key: sorted(values) for key, values in self.samples.items()}
+
+    def reset(self):
+        with self.lock:
+            for name in self:
+                self[name] = 0
+            self.samples.clear()
+
+
+def start_run():
+    global run_id, run_started
+    with _lock:
+        run_id = uuid.uuid4().hex[:12]
+        run_started = time.time()
+        spans.clear()
+        usage_totals.clear()
+    for hook in run_start_hooks:
+        hook()
+    return run_id
+
+
+@contextmanager
+def span(stage, **labels):
+    # Times a block of work, failed blocks are recorded with ok=False
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        with _lock:
+            spans.append(
+                {
+                    "stage": stage,
+                    "labels": labels,
+                    "seconds": time.perf_counter() - start,
+                    "ok": ok,
+                }
+            )
+
+
+def current_run_id():
+    return run_id
+
+
+def record_usage(model, usage):
+    # Token counts (and the cost OpenRouter adds to usage) of one response,
+    # returned so callers can store them with the response
+    if usage is None:
+        return None
+    response_usage = {field: getattr(usage, field, None) or 0 for field in USAGE_FIELDS}
+    cost = getattr(usage, "cost", None)
+    if cost is None and getattr(usage, "model_extra", None):
+        cost = usage.model_extra.get("cost")
+    response_usage["cost"] = cost or 0
+    with _lock:
+        totals = usage_totals[model]
+        totals["requests"] += 1
+        for field, value in response_usage.items():
+            totals[field] += value
+    return response_usage
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return 0.0
+    index = math.ceil(fraction * len(values)) - 1
+    return values[max(0, min(len(values) - 1, index))]
+
+
+def summarize_durations(durations, errors=0):
+    durations = sorted(durations)
+    return {
+        "count": len(durations),
+        "errors": errors,
+        "total_seconds": round(sum(durations), 3),
+        "p50": round(percentile(durations, 0.5), 3),
+        "p95": round(percentile(durations, 0.95), 3),
+        "max": round(durations[-1], 3) if durations else 0.0,
+    }
+
+
+def build_run_report(counters=None):
+    with _lock:
+        recorded = list(spans)
+        usage = {model: dict(totals) for model, totals in usage_totals.items()}
+
+    stage_durations = defaultdict(list)
+    stage_errors = defaultdict(int)
+    model_durations = defaultdict(list)
+    model_errors = defaultdict(int)
+    for entry in recorded:
+        stage_durations[entry["stage"]].append(entry["seconds"])
+        stage_errors[entry["stage"]] += not entry["ok"]
+        model = entry["labels"].get("model")
+        if model:
+            model_durations[model].append(entry["seconds"])
+            model_errors[model] += not entry["ok"]
+
+    models = {}
+    for model in sorted(set(model_durations) | set(usage)):
+        models[model] = summarize_durations(model_durations[model], model_errors[model])
+        models[model].update(usage.get(model, {}))
+
+    finished = time.time()
+    return {
+        "run_id": run_id,
+        "started": datetime.fromtimestamp(run_started).isoformat(),
+        "finished": datetime.fromtimestamp(finished).isoformat(),
+        "wall_seconds": round(finished - run_started, 3),
+        "stages": {
+            stage: summarize_durations(durations, stage_errors[stage])
+            for stage, durations in sorted(stage_durations.items())
+        },
+        "models": models,
+        "counters": counters or {},
+    }
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(**labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{key}="{escape_label_value(value)}"' for key, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def build_prometheus_metrics(report):
+    lines = []
+
+    def metric(name, metric_type, help_text, samples):
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} {metric_type}")
+        for suffix, labels, value in samples:
+            lines.append(
+                f"{METRIC_PREFIX}_{name}{suffix}{format_labels(**labels)} {value}"
+            )
+
+    def duration_samples(label, groups):
+        samples = []
+        for key, stats in groups.items():
+            samples.append(("", {label: key, "quantile": "0.5"}, stats["p50"]))
+            samples.append(("", {label: key, "quantile": "0.95"}, stats["p95"]))
+            samples.append(("_sum", {label: key}, stats["total_seconds"]))
+            samples.append(("_count", {label: key}, stats["count"]))
+        return samples
+
+    metric(
+        "stage_duration_seconds",
+        "summary",
+        "Duration of the pipeline stages of the last run.",
+        duration_samples("stage", report["stages"]),
+    )
+    metric(
+        "model_duration_seconds",
+        "summary",
+        "Request duration per model of the last run.",
+        duration_samples("model", report["models"]),
+    )
+    metric(
+        "model_tokens",
+        "gauge",
+        "Tokens used per model in the last run.",
+        [
+            ("", {"model": model, "kind": field.replace("_tokens", "")}, stats[field])
+            for model, stats in report["models"].items()
+            for field in USAGE_FIELDS
+            if field in stats
+        ],
+    )
+    metric(
+        "model_cost",
+        "gauge",
+        "Cost reported by OpenRouter per model in the last run.",
+        [
+            ("", {"model": model}, stats["cost"])
+            for model, stats in report["models"].items()
+            if "cost" in stats
+        ],
+    )
+    metric(
+        "run_duration_seconds",
+        "gauge",
+        "Wall time of the last run.",
+        [("", {}, report["wall_seconds"])],
+    )
+    metric(
+        "run_finished_timestamp_seconds",
+        "gauge",
+        "Time the last run finished.",
+        [("", {}, round(time.time(), 3))],
+    )
+    return "\n".join(lines) + "\n"
+
+
+def write_atomically(path, content):
+    directory = os.path.dirname(path)
+    if directory:
+        check_if_directory_exists(directory)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(content)
+    os.replace(temp_path, path)
+
+
+def write_run_report(counters=None):
+    report = build_run_report(counters)
+
+    check_if_directory_exists(run_report_directory)
+    timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M")
+    report_path = os.path.join(run_report_directory, f"run-{timestamp}-{run_id}.json")
+    write_atomically(report_path, json.dumps(report, indent=2, default=str))
+
+    if metrics_textfile:
+        write_atomically(metrics_textfile, build_prometheus_metrics(report))
+
+    for stage, stats in report["stages"].items():
+        print_status(
+            f"Stage '{stage}': {stats['count']}x, p50 {stats['p50']:.2f} s, "
+            f"p95 {stats['p95']:.2f} s, total {stats['total_seconds']:.1f} s"
+        )
+    print_status(f"Run report written to {report_path}")
+    return report
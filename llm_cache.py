@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from decouple import config
+
+from helper_func import check_if_directory_exists, print_status
+from instrumentation import Counters, reset_on_run_start
+
+# Response cache: location, time to live in seconds, maximum size and a flag to
+# ignore cached entries (fresh responses are still written to the cache)
+llm_cache_directory = config("LLM_CACHE_DIRECTORY", default=".llm_cache")
+llm_cache_ttl = int(config("LLM_CACHE_TTL", default=7 * 24 * 3600))
+llm_cache_max_mb = float(config("LLM_CACHE_MAX_MB", default=500))
+llm_cache_bypass = config("LLM_CACHE_BYPASS", default=False, cast=bool)
+
+# A full cache is evicted down to this share of its maximum size, so it is
+# not scanned again on the very next write
+EVICTION_TARGET = 0.9
+
+cache_stats = Counters("hits", "misses", "writes", "evictions")
+
+# Size of the cache in bytes, None until the first write of a run scanned it
+_cache_bytes = None
+_eviction_lock = threading.Lock()
+
+
+def make_cache_key(model, *parts):
+    # Content-addressed key over the model and everything sent to it, so a
+    # changed prompt, screenshot or setup text never returns a stale response
+    digest = hashlib.sha256()
+    for part in (model, *parts):
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def get_cache_path(key):
+    return os.path.join(llm_cache_directory, key[:2], f"{key}.json")
+
+
+def get_cached_response(key):
+    if llm_cache_bypass:
+        cache_stats.count("misses")
+        return None
+
+    path = get_cache_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            entry = json.load(file)
+    except (OSError, ValueError):
+        cache_stats.count("misses")
+        return None
+
+    if time.time() - entry.get("created", 0) > llm_cache_ttl:
+        remove_cache_entry(path)
+        cache_stats.count("misses")
+        return None
+
+    # Refresh the access time, eviction removes the least recently used entries
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    cache_stats.count("hits")
+    return entry.get("response")
+
+
+def set_cached_response(key, response, model=None):
+    if not response:
+        return
+
+    path = get_cache_path(key)
+    check_if_directory_exists(os.path.dirname(path))
+    try:
+        previous_size = os.path.getsize(path)
+    except OSError:
+        previous_size = 0
+
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(
+                {"model": model, "created": time.time(), "response": response}, file
+            )
+        size = os.path.getsize(temp_path)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print_status(f"Failed to write LLM cache entry {path}: {e}")
+        return
+
+    cache_stats.count("writes")
+    track_cache_size(size - previous_size)
+
+
+@reset_on_run_start
+def forget_cache_size():
+    # Every run scans the cache once, which also drops the expired entries
+    global _cache_bytes
+    with _eviction_lock:
+        _cache_bytes = None
+
+
+def track_cache_size(added_bytes):
+    # The directory is only scanned when the cache outgrew its maximum size
+    global _cache_bytes
+    with _eviction_lock:
+        if _cache_bytes is not None:
+            _cache_bytes += added_bytes
+            if _cache_bytes <= llm_cache_max_mb * 1024 * 1024:
+                return
+    evict_cache()
+
+
+def evict_cache():
+    # Drop entries not used within the TTL (so certainly expired), then the
+    # least recently used ones until the cache fits into the configured size
+    global _cache_bytes
+    with _eviction_lock:
+        entries = []
+        now = time.time()
+        for root, _dirs, files in os.walk(llm_cache_directory):
+            for filename in files:
+                if not filename.endswith(".json"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > llm_cache_ttl:
+                    remove_cache_entry(path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+        max_bytes = llm_cache_max_mb * 1024 * 1024
+        total_bytes = sum(size for _mtime, size, _path in entries)
+        if total_bytes > max_bytes:
+            for _mtime, size, path in sorted(entries):
+                if total_bytes <= max_bytes * EVICTION_TARGET:
+                    break
+                remove_cache_entry(path)
+                total_bytes -= size
+        _cache_bytes = total_bytes
+
+
+def remove_cache_entry(path):
+    try:
+        os.remove(path)
+        cache_stats.count("evictions")
+    except OSError:
+        pass
+
+
+def print_cache_stats():
+    print_status(
+        f"LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+        f"{cache_stats['writes']} writes, {cache_stats['evictions']} evictions"
+    )
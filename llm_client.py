@@ -0,0 +1,170 @@
+import threading
+import time
+import weakref
+
+from decouple import config
+
+from helper_func import print_status
+from instrumentation import Counters
+
+# Connection pool and timeouts of the shared HTTP client, HTTP/2 needs the h2 package
+http2_enabled = config("HTTP2", default=False, cast=bool)
+http_max_connections = int(config("HTTP_MAX_CONNECTIONS", default=20))
+http_max_keepalive_connections = int(
+    config("HTTP_MAX_KEEPALIVE_CONNECTIONS", default=10)
+)
+http_keepalive_expiry = float(config("HTTP_KEEPALIVE_EXPIRY", default=90))
+http_connect_timeout = float(config("HTTP_CONNECT_TIMEOUT", default=10))
+http_read_timeout = float(config("HTTP_READ_TIMEOUT", default=180))
+
+http_stats = Counters("requests", "new_connections", "reused_connections")
+
+_clients = {}
+_async_clients = {}
+_clients_lock = threading.Lock()
+_connections_lock = threading.Lock()
+_request_starts = {}
+_seen_streams = weakref.WeakSet()
+
+
+# openai and httpx are imported with the first client, commands that never
+# call a model do not pay for importing them
+def get_http_limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=http_max_connections,
+        max_keepalive_connections=http_max_keepalive_connections,
+        keepalive_expiry=http_keepalive_expiry,
+    )
+
+
+def get_http_timeout():
+    import httpx
+
+    return httpx.Timeout(http_read_timeout, connect=http_connect_timeout)
+
+
+def check_http2():
+    if not http2_enabled:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print_status(
+            "Warning: HTTP2 is enabled but h2 is not installed, using HTTP/1.1"
+        )
+        return False
+    return True
+
+
+def on_request(request):
+    with _connections_lock:
+        _request_starts[id(request)] = time.perf_counter()
+
+
+def on_response(response):
+    # Latency is measured up to the response headers, a network stream seen
+    # before means the request went over a kept-alive connection
+    with _connections_lock:
+        start = _request_starts.pop(id(response.request), None)
+        stream = response.extensions.get("network_stream")
+        reused = None
+        if stream is not None:
+            try:
+                reused = stream in _seen_streams
+                _seen_streams.add(stream)
+            except TypeError:
+                pass
+
+    http_stats.count("requests")
+    if start is not None:
+        http_stats.add_sample("latency", time.perf_counter() - start)
+    if reused is not None:
+        http_stats.count("reused_connections" if reused else "new_connections")
+
+
+async def on_async_request(request):
+    on_request(request)
+
+
+async def on_async_response(response):
+    on_response(response)
+
+
+def get_openai_client(api_key, base_url):
+    # One long-lived client per endpoint, shared by every stage and thread of a run
+    import httpx
+    from openai import OpenAI
+
+    with _clients_lock:
+        client = _clients.get((api_key, base_url))
+        if client is None:
+            http_client = httpx.Client(
+                http2=check_http2(),
+                limits=get_http_limits(),
+                timeout=get_http_timeout(),
+                event_hooks={"request": [on_request], "response": [on_response]},
+            )
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=get_http_timeout(),
+                http_client=http_client,
+            )
+            _clients[(api_key, base_url)] = client
+        return client
+
+
+def get_async_openai_client(api_key, base_url):
+    import httpx
+    from openai import AsyncOpenAI
+
+    with _clients_lock:
+        client = _async_clients.get((api_key, base_url))
+        if client is None:
+            http_client = httpx.AsyncClient(
+                http2=check_http2(),
+                limits=get_http_limits(),
+                timeout=get_http_timeout(),
+                event_hooks={
+                    "request": [on_async_request],
+                    "response": [on_async_response],
+                },
+            )
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=get_http_timeout(),
+                http_client=http_client,
+            )
+            _async_clients[(api_key, base_url)] = client
+        return client
+
+
+def close_openai_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+async def close_async_openai_clients():
+    with _clients_lock:
+        clients = list(_async_clients.values())
+        _async_clients.clear()
+    for client in clients:
+        await client.close()
+
+
+def print_http_stats():
+    if not http_stats["requests"]:
+        return
+    latencies = http_stats.get_samples().get("latency", [])
+    median = latencies[len(latencies) // 2] if latencies else 0
+    print_status(
+        f"HTTP: {http_stats['requests']} requests, "
+        f"{http_stats['new_connections']} connections opened, "
+        f"{http_stats['reused_connections']} reused, "
+        f"median latency {median:.2f} s, max {max(latencies, default=0):.2f} s"
+    )
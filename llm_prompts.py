@@ -93,6 +93,26 @@ Return ONLY as JSON format with the following keys: direction, entry, stop_loss,
 No further comments or code block delimiters in your response, only plain JSON.
 """
 
+BATCH_SUMMARY_SYSTEM_PROMPT = """You receive several trading setup texts. Each one starts with a line "### <filename>".
+
+For each text, extract these values:
+- Trading direction (Long/Short)
+- Entry price (number)
+- Stop loss (number)
+- Take profit (number)
+- Risk reward ratio (number)
+
+Calculate these values:
+- Risk reward ratio (number) if not provided in the text
+- Stop loss pips (number)
+- Take profit pips (number)
+
+If a text has no clear trading setup or multiple trading setups with given entry, stop loss and take profit, set "None" as direction and zero for all numbers.
+
+Return ONLY a JSON array with one object per text, in the given order, with the following keys: filename, direction, entry, stop_loss, take_profit, rrr, stop_loss_pips, take_profit_pips
+No further comments or code block delimiters in your response, only plain JSON.
+"""
+
 TRADING_SYSTEM_PROMPT_OLD = "You are the expert in analyzing screenshots of candlestick charts and finding successful profitable trading setups for great profits."
 
 TRADING_USER_PROMPT_OLD = """
@@ -1,151 +1,452 @@
-import base64
 import os
 import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from functools import cache, partial
 from datetime import datetime
 from glob import glob
 
-from openpyxl import Workbook
-from openpyxl.styles import Font
-from openpyxl.utils import get_column_letter
-from openai import OpenAI
 from decouple import config
 from tqdm import tqdm
-from playwright.sync_api import sync_playwright
 
 from llm_prompts import (
     SUMMARY_SYSTEM_PROMPT,
+    BATCH_SUMMARY_SYSTEM_PROMPT,
     TRADING_SYSTEM_PROMPT,
     TRADING_USER_PROMPT,
 )
+from pipeline import Pipeline, Stage
+from image_payload import (
+    get_symbol_payload,
+    get_symbol_payload_from_images,
+    release_symbol_payload,
+    payload_stats,
+)
+from chart_capture import (
+    in_memory_capture,
+    download_chart_screenshot,
+    capture_chart_image,
+)
+from chart_readiness import (
+    get_readiness_stats,
+    attach_readiness_monitor,
+    detach_readiness_monitor,
+    wait_for_chart_ready,
+    print_readiness_stats,
+)
+from instrumentation import (
+    span,
+    record_usage,
+    start_run,
+    current_run_id,
+    write_run_report,
+)
+from llm_client import (
+    get_openai_client,
+    close_openai_clients,
+    print_http_stats,
+    http_stats,
+)
+from request_executor import (
+    execute_request,
+    is_model_available,
+    print_executor_stats,
+    executor_stats,
+)
+from batch_summary import (
+    SUMMARY_KEYS,
+    batch_summaries,
+    batch_stats,
+    format_batch_input,
+    parse_batch_response,
+    print_batch_stats,
+)
+from streaming import (
+    stream_completions,
+    stream_completion,
+    get_stream_stats,
+    print_stream_stats,
+)
+from setup_parser import parse_trading_setup, print_parser_stats, parser_stats
+from manifest import (
+    incremental_mode,
+    load_manifest,
+    get_fresh_capture,
+    record_capture,
+    get_capture_files,
+    get_captures_digest,
+    is_setup_done,
+    is_setup_current,
+    record_setup,
+    get_done_summary,
+    record_summary,
+    is_report_done,
+    record_report,
+)
+from results_store import (
+    begin_run,
+    finish_run,
+    add_setup,
+    add_summary,
+    flush_results,
+    query_summaries,
+    store_enabled,
+)
+from llm_cache import (
+    make_cache_key,
+    get_cached_response,
+    set_cached_response,
+    print_cache_stats,
+    cache_stats,
+)
 from helper_func import (
     print_status,
     save_trading_setup_to_file,
+    get_trading_setup_path,
+    get_setup_name,
     get_symbol_directory,
     get_download_directory,
     get_trading_setups_directory,
     clear_download_directory,
 )
 
-# Configuration
-endpoint_url = config("ENDPOINT_URL")
-website_url = config("WEBSITE_URL")
-tf_reload_timeout = int(config("TF_RELOAD_TIMEOUT"))
-chart_reload_timeout = int(config("CHART_RELOAD_TIMEOUT"))
-timeframes = json.loads(config("TIMEFRAMES"))
-symbols = json.loads(config("SYMBOLS"))
+# Configuration, the settings only some stages need (browser, API key and
+# summary model) are read when they are first used, see get_setting()
+timeframes = json.loads(config("TIMEFRAMES", default="[]"))
+symbols = json.loads(config("SYMBOLS", default="[]"))
 
-openrouter_api_key = config("OPENROUTER_API_KEY")
-openrouter_base_url = "https://openrouter.ai/api/v1"
-summary_model = config("SUMMARY_MODEL")
+openrouter_base_url = config(
+    "OPENROUTER_BASE_URL", default="https://openrouter.ai/api/v1"
+)
+# Asks OpenRouter to include the cost in the usage of each response
+USAGE_ACCOUNTING = {"usage": {"include": True}}
+local_setup_parser = config("LOCAL_SETUP_PARSER", default=True, cast=bool)
 
-# Load OpenRouter models from .env as a JSON list string
+# Concurrency limits for model requests: a global cap shared by all requests and
+# optional per-model caps given as a JSON object, e.g. '{"openai/gpt-4o": 2}'
+max_concurrent_requests = int(config("MAX_CONCURRENT_REQUESTS", default=4))
 try:
-    openrouter_models_raw = config("OPENROUTER_MODELS")
-    openrouter_models = json.loads(openrouter_models_raw)
-    if not isinstance(openrouter_models, list):
-        raise ValueError("OPENROUTER_MODELS is not a valid JSON list")
+    model_concurrency = json.loads(config("MODEL_CONCURRENCY", default="{}"))
+    if not isinstance(model_concurrency, dict):
+        raise ValueError("MODEL_CONCURRENCY is not a valid JSON object")
 except Exception as e:
-    print_status(f"Error loading or parsing OPENROUTER_MODELS from .env: {e}")
-    openrouter_models = []
+    print_status(f"Error loading or parsing MODEL_CONCURRENCY from .env: {e}")
+    model_concurrency = {}
+
+request_slots = threading.BoundedSemaphore(max(1, max_concurrent_requests))
+model_request_slots = {}
+model_request_slots_lock = threading.Lock()
+
+# Pipeline configuration: enabled stages (in processing order), size of the
+# queues between the stages and number of workers per stage
+PIPELINE_STAGE_ORDER = ["capture", "analyze", "summarize", "report"]
+pipeline_stages = json.loads(
+    config("PIPELINE_STAGES", default=json.dumps(PIPELINE_STAGE_ORDER))
+)
+pipeline_queue_size = int(config("PIPELINE_QUEUE_SIZE", default=1))
+try:
+    pipeline_workers = json.loads(config("PIPELINE_WORKERS", default="{}"))
+    if not isinstance(pipeline_workers, dict):
+        raise ValueError("PIPELINE_WORKERS is not a valid JSON object")
+except Exception as e:
+    print_status(f"Error loading or parsing PIPELINE_WORKERS from .env: {e}")
+    pipeline_workers = {}
+
+# Capture workers (PIPELINE_WORKERS "capture") open a tab each in the default
+# browser context or, with "context", a separate browser context each
+capture_isolation = config("CAPTURE_ISOLATION", default="tab").lower()
+capture_retries = int(config("CAPTURE_RETRIES", default=1))
+
+# Excel reports: "per_symbol" writes a workbook per symbol whose models agree,
+# "consolidated" streams every symbol into one workbook with a consensus sheet
+EXCEL_REPORT_MODES = ("per_symbol", "consolidated")
+excel_report_mode = config("EXCEL_REPORT_MODE", default="per_symbol").lower()
+
+
+@cache
+def get_setting(name, cast=str):
+    # Required settings of a single stage, so e.g. re-summarizing does not
+    # need the browser settings
+    return config(name, cast=cast)
+
+
+@cache
+def get_openrouter_models():
+    # Load OpenRouter models from .env as a JSON list string, only the stages
+    # that ask the models need it
+    try:
+        models = json.loads(config("OPENROUTER_MODELS", default="[]"))
+        if not isinstance(models, list):
+            raise ValueError("OPENROUTER_MODELS is not a valid JSON list")
+    except Exception as e:
+        print_status(f"Error loading or parsing OPENROUTER_MODELS from .env: {e}")
+        return []
+    return models
 
 
 # --- Screenshot Functionality ---
 def take_screenshots_for_symbol(symbol, page):
     # print_status(f"Taking Tradingview screenshots for {symbol}...")
 
+    # In-memory captures are returned to the caller as (filename, bytes), in
+    # incremental mode every capture is kept on disk and read from the manifest
+    images = [] if in_memory_capture() and not incremental_mode else None
+
+    pending_timeframes = timeframes
+    if incremental_mode:
+        manifest = load_manifest(symbol)
+        pending_timeframes = [
+            timeframe
+            for timeframe in timeframes
+            if not get_fresh_capture(manifest, symbol, timeframe)
+        ]
+        if not pending_timeframes:
+            print_status(f"Screenshots for {symbol} are still fresh, skipping capture")
+            return images
+
+    # Screenshots of an attempt that fails are removed, the retry on another
+    # tab captures every timeframe again and the analysis globs the directory
+    written = []
+    try:
+        capture_timeframes(symbol, page, pending_timeframes, images, written)
+    except Exception:
+        if not incremental_mode:
+            for path in written:
+                if os.path.exists(path):
+                    os.remove(path)
+        raise
+
+    # print_status(f"Screenshots completed for {symbol}!") # Removed to fix progress bar
+    return images
+
+
+def capture_timeframes(symbol, page, pending_timeframes, images, written):
+    # Appends the path of every screenshot saved in the symbol directory to written
     download_directory = get_symbol_directory(symbol)
+    tf_reload_timeout = get_setting("TF_RELOAD_TIMEOUT", cast=int)
 
+    # Each wait ends as soon as the chart has settled, the configured timeouts
+    # are only the upper bound
+    symbol_name = symbol.split(":")[1]
     page.keyboard.type(symbol)
-    page.wait_for_timeout(tf_reload_timeout)
+    wait_for_chart_ready(page, tf_reload_timeout, "symbol_search")
     page.keyboard.press("Enter")
-    page.wait_for_timeout(tf_reload_timeout)
+    wait_for_chart_ready(page, tf_reload_timeout, "symbol_change", symbol=symbol_name)
 
     # Loop through timeframes for the current symbol with a progress bar
-    for timeframe in tqdm(timeframes, desc=f"Timeframes for {symbol}", leave=False):
+    for timeframe in tqdm(
+        pending_timeframes, desc=f"Timeframes for {symbol}", leave=False
+    ):
         # Change timeframe by typing
         page.keyboard.type(timeframe)
-        page.wait_for_timeout(tf_reload_timeout)
+        wait_for_chart_ready(page, tf_reload_timeout, "interval_search")
         page.keyboard.press("Enter")
-        page.wait_for_timeout(chart_reload_timeout)
-
-        # Download screenshot
-        with page.expect_download() as download_info:
-            page.keyboard.press("Control+Alt+S")
-
-        download = download_info.value
+        wait_for_chart_ready(
+            page,
+            get_setting("CHART_RELOAD_TIMEOUT", cast=int),
+            "interval_change",
+            symbol=symbol_name,
+            interval=timeframe,
+        )
 
-        # Wait for the download process to complete and save the downloaded file in specified path
-        download.save_as(os.path.join(download_directory, download.suggested_filename))
+        if not in_memory_capture():
+            path = download_chart_screenshot(page, download_directory)
+        else:
+            filename, data = capture_chart_image(
+                page,
+                symbol_name,
+                timeframe,
+                download_directory,
+                persist=True if incremental_mode else None,
+            )
+            path = os.path.join(download_directory, filename)
+            if images is not None:
+                images.append((filename, data))
+        written.append(path)
 
-    # print_status(f"Screenshots completed for {symbol}!") # Removed to fix progress bar
+        if incremental_mode:
+            record_capture(symbol, timeframe, path)
 
 
 # --- Trading Setup Generation Functionality ---
-def generate_setups_for_symbol(symbol):
+def generate_setups_for_symbol(symbol, images=None, models=None):
     # print_status(f"Generating trading setups for {symbol}...") # Removed to fix progress bar
 
-    symbol_dir = get_symbol_directory(symbol)
+    manifest = load_manifest(symbol) if incremental_mode else None
+    if images is None:
+        symbol_dir = get_symbol_directory(symbol)
 
-    # Get list of all files in the download directory
-    screenshot_files = glob(os.path.join(symbol_dir, "*.png"))
-    if not screenshot_files:
-        print_status(
-            f"Warning: No screenshots found in download directory: {symbol_dir}"
-        )
+        # Get list of all files in the download directory, incremental runs
+        # only use the latest capture of every timeframe
+        if incremental_mode:
+            screenshot_files = get_capture_files(manifest, symbol, timeframes)
+        else:
+            screenshot_files = glob(os.path.join(symbol_dir, "*.png"))
+        if not screenshot_files:
+            print_status(
+                f"Warning: No screenshots found in download directory: {symbol_dir}"
+            )
+            return
+    elif not images:
+        print_status(f"Warning: No screenshots captured for {symbol}")
         return
 
-    if not openrouter_models:
+    # models narrows OPENROUTER_MODELS down, e.g. to the models given on the
+    # command line
+    models = get_openrouter_models() if models is None else models
+    if not models:
         print_status(
             "No models found in OPENROUTER_MODELS. Skipping setup generation for this symbol."
         )
         return
 
-    with tqdm(
-        total=len(openrouter_models), desc=f"Generating setups {symbol}", leave=False
-    ) as pbar:
-        for model_name in openrouter_models:
-            # print_status(f"Generating setup for {symbol} using model: {model_name}") # Removed printing
-            setup = get_openai_trading_setup(
-                openrouter_api_key,
-                openrouter_base_url,
+    # Models that already answered for exactly these screenshots are skipped
+    captures_digest = None
+    if incremental_mode:
+        captures_digest = get_captures_digest(manifest, timeframes)
+        models = [
+            model_name
+            for model_name in models
+            if not is_setup_done(
+                manifest,
                 model_name,
-                screenshot_files,
+                captures_digest,
+                get_trading_setup_path(symbol, model_name),
             )
+        ]
+        if not models:
+            print_status(f"Trading setups for {symbol} are up to date, skipping")
+            return
+
+    # The previous setup of a model must not be summarized when the model
+    # fails on the new screenshots
+    for model_name in models:
+        setup_path = get_trading_setup_path(symbol, model_name)
+        if os.path.exists(setup_path):
+            os.remove(setup_path)
+
+    # Screenshots are read and encoded once, every model request shares the
+    # same messages
+    with span("encode", symbol=symbol):
+        if images is None:
+            payload = get_symbol_payload(symbol, screenshot_files)
+        else:
+            payload = get_symbol_payload_from_images(symbol, images)
+        messages = openai_message_content(payload)
+    if messages is None:
+        release_symbol_payload(symbol)
+        return
+
+    # All model requests for the symbol are sent in parallel, the request slots
+    # keep the number of in-flight requests within the configured caps
+    with (
+        ThreadPoolExecutor(max_workers=len(models)) as executor,
+        tqdm(
+            total=len(models),
+            desc=f"Generating setups {symbol}",
+            leave=False,
+        ) as pbar,
+    ):
+        futures = {
+            executor.submit(
+                get_limited_trading_setup,
+                model_name,
+                messages,
+                payload.digest,
+                get_trading_setup_path(symbol, model_name),
+            ): model_name
+            for model_name in models
+        }
+        for future in as_completed(futures):
+            model_name = futures[future]
+            setup, usage, cached = future.result()
             if setup:
                 save_trading_setup_to_file(symbol, setup, model_name)
+                add_setup(
+                    current_run_id(),
+                    symbol.split(":")[1],
+                    model_name,
+                    get_setup_name(model_name),
+                    timeframes,
+                    setup,
+                    usage,
+                    cached,
+                )
+                if incremental_mode:
+                    record_setup(symbol, model_name, captures_digest)
             else:
                 print_status(
                     f"Failed to generate setup for {symbol} with model {model_name}"
                 )
             pbar.update(1)
 
-
-def openai_message_content(screenshot_files):
+    release_symbol_payload(symbol)
+
+
+def get_model_request_slot(model_name):
+    with model_request_slots_lock:
+        slot = model_request_slots.get(model_name)
+        if slot is None:
+            limit = int(model_concurrency.get(model_name, max_concurrent_requests))
+            slot = threading.BoundedSemaphore(max(1, limit))
+            model_request_slots[model_name] = slot
+        return slot
+
+
+@contextmanager
+def model_request_slot(model_name):
+    # Take the per-model slot first so a throttled model does not hold a global slot
+    with get_model_request_slot(model_name), request_slots:
+        yield
+
+
+def get_limited_trading_setup(model_name, messages, payload_digest, setup_path=None):
+    # Returns (setup, token usage, cached), unchanged screenshots and prompts
+    # return the cached response right away without usage; a streamed setup
+    # is written next to setup_path while it arrives
+    cache_key = make_cache_key(
+        model_name, TRADING_SYSTEM_PROMPT, TRADING_USER_PROMPT, payload_digest
+    )
+    setup = get_cached_response(cache_key)
+    if setup is not None:
+        return setup, None, True
+
+    # A model that keeps failing is skipped without waiting for a slot
+    if not is_model_available(model_name):
+        print_status(f"Skipping {model_name}, it failed repeatedly")
+        return None, None, False
+
+    # Every attempt and hedged duplicate takes its own slots, retries wait for
+    # their backoff without holding one
+    setup, usage = get_openai_trading_setup(
+        get_setting("OPENROUTER_API_KEY"),
+        openrouter_base_url,
+        model_name,
+        messages,
+        setup_path,
+        partial(model_request_slot, model_name),
+    )
+
+    set_cached_response(cache_key, setup, model_name)
+    return setup, usage, False
+
+
+def openai_message_content(payload):
     system_role = {"role": "system", "content": TRADING_SYSTEM_PROMPT}
     user_role = {
         "role": "user",
         "content": [{"type": "text", "text": TRADING_USER_PROMPT}],
     }
 
-    # Add images to the user message content
-    images_processed = 0
-    for screenshot in screenshot_files:
-        try:
-            with open(screenshot, "rb") as file:
-                base64_image = base64.b64encode(file.read()).decode("utf-8")
-                user_role["content"].append(
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{base64_image}"},
-                    }
-                )
-                images_processed += 1
-        except Exception as e:
-            print_status(f"Error processing image {screenshot}: {e}")
-            continue
+    # Add the prepared images to the user message content
+    for image in payload.images:
+        user_role["content"].append(
+            {"type": "image_url", "image_url": {"url": image.data_url}}
+        )
 
-    if images_processed == 0:
+    if not payload.images:
         print_status("No valid images were processed. Cannot proceed with analysis.")
         return None
 
@@ -154,72 +455,248 @@ def openai_message_content(screenshot_files):
     return messages
 
 
-def get_openai_trading_setup(openai_api_key, openai_base_url, model, screenshot_files):
+def get_openai_trading_setup(
+    openai_api_key, openai_base_url, model, messages, setup_path=None, slot=None
+):
     try:
-        client = OpenAI(api_key=openai_api_key, base_url=openai_base_url)
-        messages = openai_message_content(screenshot_files)
+        client = get_openai_client(openai_api_key, openai_base_url)
+
+        # Retries, hedged duplicates and the deadline are handled by the
+        # executor, so the client's own retries are off
+        def request(timeout):
+            with span("model", model=model):
+                completions = client.with_options(
+                    max_retries=0, timeout=timeout
+                ).chat.completions
+                if not stream_completions:
+                    response = completions.create(
+                        model=model, messages=messages, extra_body=USAGE_ACCOUNTING
+                    )
+                    return response.choices[0].message.content, response.usage
+
+                # A stream can be stopped once the setup or the verdict is in
+                return stream_completion(
+                    model,
+                    lambda: completions.create(
+                        model=model,
+                        messages=messages,
+                        extra_body=USAGE_ACCOUNTING,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                    ),
+                    setup_path,
+                )
 
-        response = client.chat.completions.create(model=model, messages=messages)
+        content, response_usage = execute_request(model, request, slot or nullcontext)
+        usage = record_usage(model, response_usage)
 
-        return response.choices[0].message.content
+        return content, usage
 
     except Exception as e:
         print_status(f"Error: {e}")
-        return None
+        return None, None
 
 
 # Removed get_chatgpt_trading_setup and get_gemini_trading_setup as all LLMs are now processed via OpenRouter.
 
 
 # --- Summary Generation Functionality ---
-def summarize_setups_for_symbol(symbol):
+def summarize_setups_for_symbol(symbol, models=None):
     # print_status(f"Summarizing trading setups for {symbol}...")
 
-    client = OpenAI(api_key=openrouter_api_key, base_url=openrouter_base_url)
-
     directory = get_trading_setups_directory(symbol)
     files = [f for f in os.listdir(directory) if f.lower().endswith(".txt")]
+    if models is not None:
+        # Only the setups of the given models
+        setup_names = {get_setup_name(model) for model in models}
+        files = [f for f in files if os.path.splitext(f)[0] in setup_names]
     summaries = []
+    manifest = None
+    if incremental_mode:
+        # Only setups generated from the current screenshots are summarized
+        manifest = load_manifest(symbol)
+        captures_digest = get_captures_digest(manifest, timeframes)
+        stale = [
+            f
+            for f in files
+            if not is_setup_current(manifest, os.path.splitext(f)[0], captures_digest)
+        ]
+        if stale:
+            print_status(
+                f"Skipping {len(stale)} setups of {symbol} that are not from "
+                f"the current screenshots"
+            )
+            files = [f for f in files if f not in stale]
+    symbol_name = symbol.split(":")[1]
+    setup_models = {get_setup_name(model): model for model in get_openrouter_models()}
 
+    # Entries of [setup name, text, summary, source], summaries that are still
+    # None after this loop are asked from the LLM together
+    entries = []
     for filename in tqdm(files, desc=f"Processing files for {symbol}", leave=False):
         file_path = os.path.join(directory, filename)
         with open(file_path, "r", encoding="utf-8") as f:
             text = f.read()
 
-        client = OpenAI(api_key=openrouter_api_key, base_url=openrouter_base_url)
+        # The fixed "Trading Setup:" block is parsed locally, the LLM is only
+        # asked when the text does not follow the expected format
+        setup_name = os.path.splitext(filename)[0]
+        summary = None
+        source = "reused"
+        if incremental_mode:
+            summary = get_done_summary(manifest, setup_name, text)
+        if summary is None and local_setup_parser:
+            source = "parser"
+            summary = parse_trading_setup(text, symbol)
+        entries.append([setup_name, text, summary, source])
+
+    llm_summaries = get_llm_summaries(
+        [
+            (setup_name, text)
+            for setup_name, text, summary, _ in entries
+            if summary is None
+        ]
+    )
+
+    for setup_name, text, summary, source in entries:
+        if summary is None:
+            source = "llm"
+            summary = llm_summaries[setup_name]
+
+        if source != "reused":
+            summary["filename"] = setup_name
+            # Summaries the LLM could not produce are retried in the next run
+            if incremental_mode and summary.get("direction") is not None:
+                record_summary(symbol, setup_name, text, summary)
+
+        add_summary(
+            current_run_id(),
+            symbol_name,
+            setup_models.get(setup_name, setup_name),
+            setup_name,
+            text,
+            summary,
+            source,
+        )
+        summaries.append(summary)
+    return summaries
+
+
+def get_llm_summaries(setups):
+    # setups is a list of (setup name, text), all of them are sent in one
+    # request and only the entries the batch did not return valid are sent
+    # one by one
+    summaries = {}
+    batched = batch_summaries and len(setups) > 1
+    if batched:
+        summaries = get_batch_llm_summary(setups)
+
+    for setup_name, text in setups:
+        if setup_name not in summaries:
+            if batched:
+                batch_stats.count("fallbacks")
+            summaries[setup_name] = get_llm_summary(text)
+    return summaries
+
+
+def get_batch_llm_summary(setups):
+    setup_names = {setup_name for setup_name, _text in setups}
+    batch_input = format_batch_input(setups)
+    summary_model = get_setting("SUMMARY_MODEL")
+    cache_key = make_cache_key(summary_model, BATCH_SUMMARY_SYSTEM_PROMPT, batch_input)
+    summary_text = get_cached_response(cache_key)
+    cached = summary_text is not None
 
-        response = client.chat.completions.create(
-            model=summary_model,
-            messages=[
-                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
-                {"role": "user", "content": text},
-            ],
+    if not cached:
+        client = get_openai_client(
+            get_setting("OPENROUTER_API_KEY"), openrouter_base_url
         )
 
+        def request(timeout):
+            with span("summary_call", model=summary_model):
+                return client.with_options(
+                    max_retries=0, timeout=timeout
+                ).chat.completions.create(
+                    model=summary_model,
+                    messages=[
+                        {"role": "system", "content": BATCH_SUMMARY_SYSTEM_PROMPT},
+                        {"role": "user", "content": batch_input},
+                    ],
+                    extra_body=USAGE_ACCOUNTING,
+                )
+
+        try:
+            response = execute_request(summary_model, request)
+        except Exception as e:
+            print_status(f"Batch summary failed: {e}")
+            return {}
+        record_usage(summary_model, response.usage)
+        batch_stats.count("requests")
+        summary_text = response.choices[0].message.content or ""
+
+    summaries = parse_batch_response(summary_text, setup_names)
+    batch_stats.count("summaries", len(summaries))
+    # Only complete batches are worth caching, single summaries cache themselves
+    if not cached and len(summaries) == len(setup_names):
+        set_cached_response(cache_key, summary_text, summary_model)
+    return summaries
+
+
+def get_llm_summary(text):
+    summary_model = get_setting("SUMMARY_MODEL")
+    cache_key = make_cache_key(summary_model, SUMMARY_SYSTEM_PROMPT, text)
+    summary_text = get_cached_response(cache_key)
+    cached = summary_text is not None
+
+    if not cached:
+        client = get_openai_client(
+            get_setting("OPENROUTER_API_KEY"), openrouter_base_url
+        )
+
+        def request(timeout):
+            with span("summary_call", model=summary_model):
+                return client.with_options(
+                    max_retries=0, timeout=timeout
+                ).chat.completions.create(
+                    model=summary_model,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                        {"role": "user", "content": text},
+                    ],
+                    extra_body=USAGE_ACCOUNTING,
+                )
+
+        try:
+            response = execute_request(summary_model, request)
+        except Exception as e:
+            # A failed summary leaves the setup unsummarized, not the symbol
+            print_status(f"Summary failed: {e}")
+            return unsummarized()
+        record_usage(summary_model, response.usage)
+
         if isinstance(response, str):
             print(f"OpenRouter API Error: {response}")
             summary_text = ""
         else:
             summary_text = response.choices[0].message.content
 
-        # Remove code block delimiters
-        summary_text = summary_text.replace("```json", "").replace("```", "")
-        try:
-            summary = json.loads(summary_text)
-        except json.JSONDecodeError as e:
-            print(f"JSONDecodeError: {e}")  # Add logging
-            summary = {
-                "direction": None,
-                "entry": None,
-                "stop_loss": None,
-                "take_profit": None,
-                "rrr": None,
-                "stop_loss_pips": None,
-                "take_profit_pips": None,
-            }
-        summary["filename"] = os.path.splitext(filename)[0]
-        summaries.append(summary)
-    return summaries
+    # Remove code block delimiters
+    summary_text = summary_text.replace("```json", "").replace("```", "")
+    try:
+        summary = json.loads(summary_text)
+        # Only responses that parse are worth caching
+        if not cached:
+            set_cached_response(cache_key, summary_text, summary_model)
+    except json.JSONDecodeError as e:
+        print(f"JSONDecodeError: {e}")  # Add logging
+        summary = unsummarized()
+    return summary
+
+
+def unsummarized():
+    # Summary of a setup the LLM could not summarize, unlike
+    # setup_parser.empty_summary() it does not mean "no setup"
+    return dict.fromkeys(SUMMARY_KEYS)
 
 
 # --- Excel Export Functionality ---
@@ -232,102 +709,302 @@ def save_summaries_to_excel_for_symbol(symbol, summaries):
 
     # Check if all directions are the same and not all are "None"
     if len(unique_directions) == 1 and "None" not in unique_directions:
-        workbook = Workbook()
-        # Remove the default sheet created by Workbook
-        default_sheet = workbook.active
-        workbook.remove(default_sheet)
-
-        sheet = workbook.create_sheet(title=symbol)
-        sheet.append(
-            [
-                "Filename",
-                "Direction",
-                "Entry",
-                "Stop Loss",
-                "Take Profit",
-                "RRR",
-                "Stop Loss Pips",
-                "Take Profit Pips",
-            ]
-        )
-        for summary in summaries:
-            sheet.append(
-                [
-                    summary.get("filename"),
-                    summary.get("direction"),
-                    summary.get("entry"),
-                    summary.get("stop_loss"),
-                    summary.get("take_profit"),
-                    summary.get("rrr"),
-                    summary.get("stop_loss_pips"),
-                    summary.get("take_profit_pips"),
-                ]
-            )
-
-        # Apply formatting to the sheet
-        # Bold header row cells
-        for cell in sheet[1]:
-            cell.font = Font(bold=True)
-        # Bold first column cells
-        for row in sheet.iter_rows(min_col=1, max_col=1):
-            for cell in row:
-                cell.font = Font(bold=True)
-        # Auto-size columns
-        for col in sheet.columns:
-            max_length = 0
-            col_letter = get_column_letter(col[0].column)
-            for cell in col:
-                if cell.value:
-                    cell_length = len(str(cell.value))
-                    if cell_length > max_length:
-                        max_length = cell_length
-            adjusted_width = max_length + 2
-            sheet.column_dimensions[col_letter].width = adjusted_width
-
         download_directory = get_download_directory()
         timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M")
         filename = f"{symbol}_trading_summaries-{timestamp}.xlsx"
         save_path = os.path.join(download_directory, filename)
-        if os.path.exists(save_path):
-            os.remove(save_path)
-        workbook.save(save_path)
-        # print_status(f"Summaries written to {save_path}")
+        # openpyxl is only imported by runs that write reports
+        from excel_export import write_summaries_workbook
 
+        write_summaries_workbook(save_path, {symbol: summaries})
+        # print_status(f"Summaries written to {save_path}")
 
-# --- Main Function ---
-def main():
-    print_status("Starting main process...")
 
-    # Delete all files from download directory
-    clear_download_directory()
+# --- Pipeline Functionality ---
+@contextmanager
+def open_tradingview_page():
+    # Playwright's sync API is bound to the thread that started it, so every
+    # capture worker opens its own connection and page
+    from playwright.sync_api import sync_playwright
 
     with sync_playwright() as p:
         # Connect to the existing browser instance
-        browser = p.chromium.connect_over_cdp(endpoint_url)
+        browser = p.chromium.connect_over_cdp(get_setting("ENDPOINT_URL"))
 
         # Get the default browser context (this will use the existing user profile)
         context = browser.contexts[0]
+        if capture_isolation == "context":
+            # A separate context per worker, logged in with the profile's cookies
+            context = browser.new_context(storage_state=context.storage_state())
 
         # Create a new page in the existing context
         page = context.new_page()
         page.set_default_timeout(10000)
+        attach_readiness_monitor(page)
+
+        # Tabs that are not in the foreground keep handling keyboard input and
+        # rendering the chart as if they were focused
+        session = context.new_cdp_session(page)
+        session.send("Emulation.setFocusEmulationEnabled", {"enabled": True})
 
         # Navigate to a website (it should already be logged in)
-        page.goto(website_url)
+        page.goto(get_setting("WEBSITE_URL"))
+
+        try:
+            yield page
+        finally:
+            # Close the page after processing all symbols
+            detach_readiness_monitor(page)
+            session.detach()
+            page.close()
+            if capture_isolation == "context":
+                context.close()
+
+
+def capture_stage(symbol, page):
+    # In-memory captures travel with the symbol to the analyze stage
+    with span("capture", symbol=symbol):
+        return symbol, take_screenshots_for_symbol(symbol, page)
+
+
+def run_capture_on_pool(capture_pool, symbol, _context):
+    return capture_pool.run(capture_stage, symbol)
+
+
+def analyze_stage(item, _context, models=None):
+    symbol, images = item if isinstance(item, tuple) else (item, None)
+    with span("analyze", symbol=symbol):
+        generate_setups_for_symbol(symbol, images, models)
+    return symbol
+
+
+def summarize_stage(item, _context, models=None):
+    symbol = item[0] if isinstance(item, tuple) else item
+    with span("summarize", symbol=symbol):
+        summaries = summarize_setups_for_symbol(symbol, models)
+        # The setups and summaries of the symbol go to the store in one batch
+        flush_results()
+        return symbol, summaries
+
+
+def report_stage(item, _context, consolidated_report=None):
+    symbol, summaries = item
+    with span("report", symbol=symbol):
+        if consolidated_report is None and (
+            incremental_mode and is_report_done(symbol, summaries)
+        ):
+            print_status(f"Report for {symbol} is up to date, skipping")
+            return symbol
+
+        # The Excel report is an export of the rows stored for this run
+        stored = summaries
+        if store_enabled():
+            stored = query_summaries(
+                run_id=current_run_id(), symbol=symbol.split(":")[1]
+            )
+        if consolidated_report is not None:
+            # Symbols whose models disagree are kept for review
+            consolidated_report.add_symbol(symbol.split(":")[1], stored)
+        else:
+            save_summaries_to_excel_for_symbol(symbol, stored)
+            if incremental_mode:
+                record_report(symbol, summaries)
+    return symbol
+
+
+def new_consolidated_report():
+    # openpyxl is only imported by runs that write reports
+    from excel_export import ConsolidatedReport
+
+    timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M")
+    return ConsolidatedReport(
+        os.path.join(get_download_directory(), f"trading_summaries-{timestamp}.xlsx")
+    )
+
+
+def close_consolidated_report(consolidated_report):
+    report_path = consolidated_report.close()
+    if report_path:
+        print_status(f"Consolidated report written to {report_path}")
+
+
+def rebuild_reports(run_symbols, models=None):
+    # Writes the Excel reports again from the latest stored summaries of each
+    # symbol, without capturing or asking any model
+    if not store_enabled():
+        raise ValueError("Rebuilding the reports needs the results store (RESULTS_DB)")
+    if excel_report_mode not in EXCEL_REPORT_MODES:
+        raise ValueError(f"Unsupported EXCEL_REPORT_MODE: {excel_report_mode}")
+    consolidated_report = None
+    if excel_report_mode == "consolidated":
+        consolidated_report = new_consolidated_report()
+
+    for symbol in run_symbols:
+        symbol_name = symbol.split(":")[1]
+        stored = query_summaries(symbol=symbol_name)
+        if models is not None:
+            stored = [summary for summary in stored if summary["model"] in models]
+        if not stored:
+            print_status(f"No stored summaries for {symbol}, no report")
+            continue
+        latest_run = stored[-1]["run_id"]
+        stored = [summary for summary in stored if summary["run_id"] == latest_run]
+        if consolidated_report is not None:
+            consolidated_report.add_symbol(symbol_name, stored)
+        else:
+            save_summaries_to_excel_for_symbol(symbol, stored)
+
+    if consolidated_report is not None:
+        close_consolidated_report(consolidated_report)
+
+
+def build_pipeline_stages(
+    stage_names, consolidated_report=None, capture_pool=None, models=None
+):
+    unknown = [name for name in stage_names if name not in PIPELINE_STAGE_ORDER]
+    if unknown:
+        raise ValueError(f"Unknown pipeline stages: {unknown}")
+    if stage_names != sorted(stage_names, key=PIPELINE_STAGE_ORDER.index):
+        raise ValueError(
+            f"Pipeline stages must follow the order {PIPELINE_STAGE_ORDER}"
+        )
+    if "report" in stage_names and "summarize" not in stage_names:
+        raise ValueError("The report stage needs the summarize stage")
+    if not timeframes and ("capture" in stage_names or "analyze" in stage_names):
+        raise ValueError("TIMEFRAMES is not set, it is needed to capture and analyze")
+    if not timeframes and incremental_mode and "summarize" in stage_names:
+        raise ValueError(
+            "TIMEFRAMES is not set, incremental runs need it to find the setups "
+            "of the current screenshots"
+        )
+
+    handlers = {
+        "capture": capture_stage,
+        "analyze": partial(analyze_stage, models=models),
+        "summarize": partial(summarize_stage, models=models),
+        "report": partial(report_stage, consolidated_report=consolidated_report),
+    }
+    stages = []
+    for name in stage_names:
+        workers = int(pipeline_workers.get(name, 1))
+        worker_context = None
+        retries = 0
+        handler = handlers[name]
+        if name == "capture":
+            # Every capture worker types symbol and timeframe changes into its
+            # own page, failed captures are retried on another page
+            worker_context = open_tradingview_page
+            retries = capture_retries
+            if capture_pool is not None:
+                # Warm pages stay on the pool's threads, the stage only hands
+                # them the symbols
+                handler = partial(run_capture_on_pool, capture_pool)
+                workers = capture_pool.workers
+                worker_context = None
+        stages.append(
+            Stage(
+                name,
+                handler,
+                workers=workers,
+                queue_size=pipeline_queue_size,
+                worker_context=worker_context,
+                retries=retries,
+            )
+        )
+    return stages
+
+
+# --- Main Function ---
+def get_run_counters():
+    return {
+        "llm_cache": dict(cache_stats),
+        "setup_parser": dict(parser_stats),
+        "http": dict(http_stats),
+        "requests": dict(executor_stats),
+        "batch_summaries": dict(batch_stats),
+        "streams": get_stream_stats(),
+        "images": dict(payload_stats),
+        "chart_waits": get_readiness_stats(),
+    }
+
 
-        for symbol in tqdm(symbols, desc="Processing Symbols"):
-            # print_status(f"Starting process for symbol: {symbol}") # Removed to fix progress bar
+def run_pipeline(
+    run_symbols,
+    capture_pool=None,
+    on_symbol_done=None,
+    stages=None,
+    models=None,
+    on_symbol_failed=None,
+):
+    # One run over the given symbols, shared by main(), the command line, the
+    # daemon and the work queue workers, which pass a generator of claimed
+    # symbols; stages and models default to PIPELINE_STAGES and OPENROUTER_MODELS.
+    # on_symbol_failed(item, error) is called as soon as a stage gives up on a symbol
+    stage_names = pipeline_stages if stages is None else stages
+    run_id = start_run()
+    known_symbols = run_symbols if isinstance(run_symbols, list) else None
+    begin_run(
+        run_id,
+        known_symbols or [],
+        timeframes,
+        get_openrouter_models() if models is None else models,
+    )
+
+    if excel_report_mode not in EXCEL_REPORT_MODES:
+        raise ValueError(f"Unsupported EXCEL_REPORT_MODE: {excel_report_mode}")
+    consolidated_report = None
+    if "report" in stage_names and excel_report_mode == "consolidated":
+        consolidated_report = new_consolidated_report()
+
+    stages = build_pipeline_stages(
+        stage_names, consolidated_report, capture_pool, models
+    )
+
+    # Symbol N+1 is captured while symbol N is analyzed, summarized and reported
+    total = len(known_symbols) if known_symbols is not None else None
+    with tqdm(total=total, desc="Processing Symbols") as pbar:
+
+        def item_done(result):
+            pbar.update(1)
+            if on_symbol_done:
+                on_symbol_done(result)
 
-            take_screenshots_for_symbol(symbol, page)
-            generate_setups_for_symbol(symbol)
-            summaries = summarize_setups_for_symbol(symbol)
-            save_summaries_to_excel_for_symbol(symbol, summaries)
+        def item_failed(item, error):
+            pbar.update(1)
+            if on_symbol_failed:
+                on_symbol_failed(item, error)
+
+        pipeline = Pipeline(stages, on_item_done=item_done, on_item_failed=item_failed)
+        pipeline.run(run_symbols)
+
+    if consolidated_report is not None:
+        close_consolidated_report(consolidated_report)
+
+    print_cache_stats()
+    print_parser_stats()
+    print_batch_stats()
+    print_stream_stats()
+    print_http_stats()
+    print_executor_stats()
+    print_readiness_stats()
+    report = write_run_report(get_run_counters())
+    finish_run(run_id, report["wall_seconds"])
+    return report
+
+
+def main():
+    print_status("Starting main process...")
+    if not symbols:
+        raise ValueError("SYMBOLS is not set")
 
-            # print_status(f"Completed process for symbol: {symbol}")
+    # Delete all files from download directory, unless the run reuses the
+    # screenshots of a previous run
+    if "capture" in pipeline_stages and not incremental_mode:
+        clear_download_directory()
 
-        # Close the page after processing all symbols
-        page.close()
+    run_pipeline(symbols)
 
+    close_openai_clients()
     print_status("Main process completed!")
 
 
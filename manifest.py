@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from decouple import config
+
+from helper_func import (
+    get_setup_name,
+    get_symbol_directory,
+    print_status,
+    text_sha256,
+)
+
+# Incremental runs keep the download directory and skip every step whose inputs
+# are still fresh according to the per-symbol manifest
+incremental_mode = config("INCREMENTAL_MODE", default=False, cast=bool)
+
+# Seconds a capture stays fresh per timeframe, e.g. '{"1D": 14400, "1H": 900}',
+# timeframes without an entry stay fresh for one candle
+try:
+    freshness_ttl = json.loads(config("FRESHNESS_TTL", default="{}"))
+    if not isinstance(freshness_ttl, dict):
+        raise ValueError("FRESHNESS_TTL is not a valid JSON object")
+except Exception as e:
+    print_status(f"Error loading or parsing FRESHNESS_TTL from .env: {e}")
+    freshness_ttl = {}
+
+MANIFEST_FILENAME = "manifest.json"
+TIMEFRAME_UNITS = {
+    "S": 1,
+    "": 60,
+    "H": 3600,
+    "D": 86400,
+    "W": 7 * 86400,
+    "M": 30 * 86400,
+}
+
+_manifest_lock = threading.Lock()
+
+
+def timeframe_seconds(timeframe):
+    # TradingView notation: "15" minutes, "4H", "1D", "W", "1M" ...
+    match = re.fullmatch(r"(\d*)([SHDWM]?)", timeframe.strip().upper())
+    if not match:
+        raise ValueError(f"Unsupported timeframe: {timeframe}")
+    count = int(match.group(1) or 1)
+    return count * TIMEFRAME_UNITS[match.group(2)]
+
+
+def get_freshness_ttl(timeframe):
+    if timeframe in freshness_ttl:
+        return float(freshness_ttl[timeframe])
+    return timeframe_seconds(timeframe)
+
+
+def get_manifest_path(symbol):
+    return os.path.join(get_symbol_directory(symbol), MANIFEST_FILENAME)
+
+
+def empty_manifest():
+    return {"captures": {}, "setups": {}, "summaries": {}, "report": {}}
+
+
+def load_manifest(symbol):
+    try:
+        with open(get_manifest_path(symbol), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return empty_manifest()
+    for section, value in empty_manifest().items():
+        manifest.setdefault(section, value)
+    return manifest
+
+
+def save_manifest(symbol, manifest):
+    # Written through a temporary file so an interrupted run never leaves a
+    # half written manifest behind
+    path = get_manifest_path(symbol)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temp_path, path)
+
+
+def update_manifest(symbol, section, key, entry):
+    with _manifest_lock:
+        manifest = load_manifest(symbol)
+        if key is None:
+            manifest[section] = entry
+        else:
+            manifest[section][key] = entry
+        save_manifest(symbol, manifest)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_fresh_capture(manifest, symbol, timeframe, now=None):
+    # Returns the capture entry when it is within its TTL and still on disk
+    entry = manifest["captures"].get(timeframe)
+    if not entry:
+        return None
+    now = now or time.time()
+    if now - entry["captured_at"] > get_freshness_ttl(timeframe):
+        return None
+    path = os.path.join(get_symbol_directory(symbol), entry["file"])
+    if not os.path.exists(path):
+        return None
+    return entry
+
+
+def expire_captures(symbol, timeframes):
+    # Marks the captures as stale so the next incremental run recaptures them
+    with _manifest_lock:
+        manifest = load_manifest(symbol)
+        for timeframe in timeframes:
+            if timeframe in manifest["captures"]:
+                manifest["captures"][timeframe]["captured_at"] = 0
+        save_manifest(symbol, manifest)
+
+
+def record_capture(symbol, timeframe, path, sha256=None):
+    manifest = load_manifest(symbol)
+    previous = manifest["captures"].get(timeframe)
+    filename = os.path.basename(path)
+    # The previous capture of the timeframe must not end up in the analysis
+    if previous and previous["file"] != filename:
+        previous_path = os.path.join(get_symbol_directory(symbol), previous["file"])
+        if os.path.exists(previous_path):
+            os.remove(previous_path)
+
+    update_manifest(
+        symbol,
+        "captures",
+        timeframe,
+        {
+            "file": filename,
+            "captured_at": time.time(),
+            "sha256": sha256 or file_sha256(path),
+        },
+    )
+
+
+def get_capture_files(manifest, symbol, timeframes):
+    directory = get_symbol_directory(symbol)
+    return [
+        os.path.join(directory, manifest["captures"][timeframe]["file"])
+        for timeframe in timeframes
+        if timeframe in manifest["captures"]
+    ]
+
+
+def get_captures_digest(manifest, timeframes):
+    # Identifies the set of screenshots a setup was generated from
+    digest = hashlib.sha256()
+    for timeframe in timeframes:
+        entry = manifest["captures"].get(timeframe)
+        digest.update(f"{timeframe}:{entry['sha256'] if entry else ''};".encode())
+    return digest.hexdigest()
+
+
+def is_setup_done(manifest, model_name, captures_digest, setup_path):
+    entry = manifest["setups"].get(model_name)
+    return (
+        entry is not None
+        and entry.get("captures") == captures_digest
+        and os.path.exists(setup_path)
+    )
+
+
+def is_setup_current(manifest, setup_name, captures_digest):
+    # setup_name is the file name of a model's setup, a setup generated from
+    # other screenshots (or not recorded at all) is stale
+    return any(
+        get_setup_name(model_name) == setup_name
+        and entry.get("captures") == captures_digest
+        for model_name, entry in manifest["setups"].items()
+    )
+
+
+def record_setup(symbol, model_name, captures_digest):
+    update_manifest(
+        symbol,
+        "setups",
+        model_name,
+        {"captures": captures_digest, "completed_at": time.time()},
+    )
+
+
+def get_done_summary(manifest, setup_name, setup_text):
+    entry = manifest["summaries"].get(setup_name)
+    if entry and entry.get("setup_sha256") == text_sha256(setup_text):
+        return dict(entry["summary"])
+    return None
+
+
+def record_summary(symbol, setup_name, setup_text, summary):
+    update_manifest(
+        symbol,
+        "summaries",
+        setup_name,
+        {
+            "setup_sha256": text_sha256(setup_text),
+            "summary": summary,
+            "completed_at": time.time(),
+        },
+    )
+
+
+def get_summaries_digest(summaries):
+    return text_sha256(json.dumps(summaries, sort_keys=True, default=str))
+
+
+def is_report_done(symbol, summaries):
+    manifest = load_manifest(symbol)
+    return manifest["report"].get("summaries") == get_summaries_digest(summaries)
+
+
+def record_report(symbol, summaries):
+    update_manifest(
+        symbol,
+        "report",
+        None,
+        {"summaries": get_summaries_digest(summaries), "completed_at": time.time()},
+    )
@@ -0,0 +1,330 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+from decouple import config
+
+from helper_func import print_status
+from results_store import get_latest_run_id, print_rows, query_summaries, store_enabled
+
+# Local OHLC history per symbol: <OHLC_DIRECTORY>/<SYMBOL>.csv or .parquet with
+# time, open, high, low and close columns, times as epoch seconds or ISO dates
+# in UTC
+ohlc_directory = config("OHLC_DIRECTORY", default="ohlc")
+# Hours a pending entry stays valid, and hours a filled trade is held before
+# it is closed at the market
+fill_expiry_hours = float(config("EVAL_FILL_EXPIRY_HOURS", default=24))
+trade_expiry_hours = float(config("EVAL_TRADE_EXPIRY_HOURS", default=120))
+
+OHLC_COLUMNS = ("time", "open", "high", "low", "close")
+COLUMN_ALIASES = {"time": ("time", "timestamp", "datetime", "date")}
+# Setups times bars compared at once, bounds the size of the window matrices
+MAX_WINDOW_CELLS = 4_000_000
+# Filled trades end at the take profit, the stop loss, the trade expiry or are
+# still open; unfilled entries expired or are still pending
+FILLED_OUTCOMES = ("tp", "sl", "time_exit", "open")
+OUTCOMES = (*FILLED_OUTCOMES, "expired", "pending", "no_data")
+GROUP_KEYS = {"model": ("model",), "symbol": ("symbol",), "both": ("model", "symbol")}
+
+
+# --- OHLC data ---
+def find_column(header, column, path):
+    for alias in COLUMN_ALIASES.get(column, (column,)):
+        if alias in header:
+            return header.index(alias)
+    raise ValueError(f"{path} has no '{column}' column")
+
+
+def parse_times(values):
+    # Epoch seconds (or milliseconds) or ISO dates, returned as epoch seconds
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[s]").astype("int64")
+    try:
+        times = values.astype("float64")
+    except ValueError:
+        text = np.char.rstrip(values.astype(str), "Z")
+        return text.astype("datetime64[s]").astype("int64")
+    if len(times) and times.max() > 1e11:
+        times = times / 1000
+    return times.astype("int64")
+
+
+def read_csv_columns(path):
+    # numpy's C parser reads the columns, times are kept as text until parsed
+    with open(path, newline="", encoding="utf-8") as file:
+        header = [column.strip().lower() for column in next(csv.reader(file), [])]
+    indexes = [find_column(header, column, path) for column in OHLC_COLUMNS]
+    options = {"delimiter": ",", "skiprows": 1, "quotechar": '"', "ndmin": 1}
+    times = np.loadtxt(path, usecols=indexes[0], dtype=str, **options)
+    prices = np.loadtxt(path, usecols=indexes[1:], dtype="float64", **options)
+    return [times, *prices.reshape(-1, 4).T]
+
+
+def read_parquet_columns(path):
+    try:
+        import pyarrow.parquet as parquet
+    except ImportError:
+        raise ValueError(f"Reading {path} needs pyarrow") from None
+    table = parquet.read_table(path)
+    header = [name.lower() for name in table.column_names]
+    return [
+        table.column(find_column(header, column, path)).to_numpy()
+        for column in OHLC_COLUMNS
+    ]
+
+
+def load_ohlc(symbol):
+    # Returns (times, opens, highs, lows, closes) sorted by time, None when
+    # there is no history for the symbol
+    for extension, reader in (
+        (".parquet", read_parquet_columns),
+        (".csv", read_csv_columns),
+    ):
+        path = os.path.join(ohlc_directory, f"{symbol}{extension}")
+        if os.path.exists(path):
+            break
+    else:
+        return None
+
+    times, *prices = reader(path)
+    times = parse_times(times)
+    order = np.argsort(times, kind="stable")
+    return (
+        times[order],
+        *(np.asarray(values, dtype="float64")[order] for values in prices),
+    )
+
+
+# --- Scoring ---
+def first_touch(starts, ends, levels, falling, lows, highs):
+    # Index of the first bar in [start, end) that reaches the level, coming
+    # down to it (low <= level) when falling, else going up (high >= level);
+    # end when no bar reaches it. All setups are scanned at once, in chunks of
+    # setups times the longest window
+    widths = np.maximum(ends - starts, 0)
+    offsets = np.zeros(len(starts), dtype="int64")
+    width = int(widths.max(initial=0))
+    if width == 0:
+        return starts + widths
+    window = np.arange(width)
+    chunk = max(1, MAX_WINDOW_CELLS // width)
+    for first in range(0, len(starts), chunk):
+        part = slice(first, first + chunk)
+        bars = np.minimum(starts[part, None] + window, len(lows) - 1)
+        level = levels[part, None]
+        hits = np.where(falling[part, None], lows[bars] <= level, highs[bars] >= level)
+        hits &= window < widths[part, None]
+        offsets[part] = np.where(hits.any(axis=1), hits.argmax(axis=1), widths[part])
+    return starts + offsets
+
+
+def score_setups(bars, created, long, entry, stop_loss, take_profit):
+    # Returns (outcome, realized R) per setup. A setup is filled by the first
+    # bar opened after it that reaches the entry, from the side the price was
+    # on; a stop loss counts from the fill bar, a take profit from the bar
+    # after it, and a bar reaching both counts as stop loss
+    times, opens, highs, lows, closes = bars
+    count = len(created)
+    outcomes = np.full(count, "no_data", dtype="<U10")
+    realized = np.full(count, np.nan)
+    last_time = times[-1]
+
+    starts = np.searchsorted(times, created, side="left")
+    has_data = starts < len(times)
+    if not has_data.any():
+        return outcomes, realized
+    index = np.flatnonzero(has_data)
+    starts = starts[index]
+    long, entry = long[index], entry[index]
+    stop_loss, take_profit = stop_loss[index], take_profit[index]
+
+    # Price before the setup decides whether the entry is a limit or a stop
+    reference = np.where(starts > 0, closes[np.maximum(starts - 1, 0)], opens[starts])
+    fill_deadline = created[index] + fill_expiry_hours * 3600
+    fill_ends = np.searchsorted(times, fill_deadline, side="left")
+    fills = first_touch(starts, fill_ends, entry, reference >= entry, lows, highs)
+    filled = fills < fill_ends
+    outcomes[index] = np.where(fill_deadline <= last_time, "expired", "pending")
+
+    index, fills = index[filled], fills[filled]
+    long, entry = long[filled], entry[filled]
+    stop_loss, take_profit = stop_loss[filled], take_profit[filled]
+    trade_deadline = times[fills] + trade_expiry_hours * 3600
+    trade_ends = np.searchsorted(times, trade_deadline, side="left")
+    stops = first_touch(fills, trade_ends, stop_loss, long, lows, highs)
+    targets = first_touch(fills + 1, trade_ends, take_profit, ~long, lows, highs)
+
+    risk = np.abs(entry - stop_loss)
+    exit_price = closes[np.maximum(trade_ends - 1, 0)]
+    stopped = (stops < trade_ends) & (stops <= targets)
+    target_hit = (targets < trade_ends) & ~stopped
+    timed_out = ~stopped & ~target_hit & (trade_deadline <= last_time)
+
+    outcomes[index] = np.select(
+        [stopped, target_hit, timed_out], ["sl", "tp", "time_exit"], "open"
+    )
+    realized[index] = np.select(
+        [stopped, target_hit, timed_out],
+        [
+            -1.0,
+            np.abs(take_profit - entry) / risk,
+            np.where(long, exit_price - entry, entry - exit_price) / risk,
+        ],
+        np.nan,
+    )
+    return outcomes, realized
+
+
+def is_valid_setup(summary):
+    levels = [summary.get(key) for key in ("entry", "stop_loss", "take_profit")]
+    if summary.get("direction") not in ("Long", "Short") or None in levels:
+        return False
+    entry, stop_loss, take_profit = levels
+    if summary["direction"] == "Long":
+        return stop_loss < entry < take_profit
+    return take_profit < entry < stop_loss
+
+
+def get_setups(**filters):
+    # Trade setups of the results store, a setup that later runs reused is
+    # only scored once, at the time it was first generated
+    setups = {}
+    for summary in query_summaries(**filters):
+        key = (summary["model"], summary["setup_sha256"])
+        if key not in setups and is_valid_setup(summary):
+            setups[key] = summary
+    return list(setups.values())
+
+
+def evaluate_setups(setups):
+    # Adds "outcome" and "r" to every setup, one vectorized pass per symbol
+    by_symbol = {}
+    for setup in setups:
+        by_symbol.setdefault(setup["symbol"], []).append(setup)
+
+    for symbol, symbol_setups in by_symbol.items():
+        bars = load_ohlc(symbol)
+        if bars is None or not len(bars[0]):
+            print_status(f"No OHLC history for {symbol} in {ohlc_directory}")
+            for setup in symbol_setups:
+                setup["outcome"], setup["r"] = "no_data", None
+            continue
+
+        outcomes, realized = score_setups(
+            bars,
+            np.array(
+                [
+                    datetime.fromisoformat(s["created_at"]).timestamp()
+                    for s in symbol_setups
+                ]
+            ),
+            np.array([s["direction"] == "Long" for s in symbol_setups]),
+            *(
+                np.array([s[key] for s in symbol_setups], dtype="float64")
+                for key in ("entry", "stop_loss", "take_profit")
+            ),
+        )
+        for setup, outcome, r in zip(symbol_setups, outcomes, realized):
+            setup["outcome"] = str(outcome)
+            setup["r"] = None if np.isnan(r) else round(float(r), 3)
+    return setups
+
+
+def summarize_outcomes(setups, group_by="model"):
+    keys = GROUP_KEYS[group_by]
+    groups = {}
+    for setup in setups:
+        groups.setdefault(tuple(setup[key] for key in keys), []).append(setup)
+
+    rows = []
+    for group, group_setups in sorted(groups.items()):
+        counts = {outcome: 0 for outcome in OUTCOMES}
+        for setup in group_setups:
+            counts[setup["outcome"]] += 1
+        closed = [setup["r"] for setup in group_setups if setup["r"] is not None]
+        decided = counts["tp"] + counts["sl"]
+        rows.append(
+            {
+                **dict(zip(keys, group)),
+                "setups": len(group_setups),
+                "filled": sum(counts[outcome] for outcome in FILLED_OUTCOMES),
+                **counts,
+                "hit_rate": round(counts["tp"] / decided, 3) if decided else None,
+                "avg_r": round(sum(closed) / len(closed), 3) if closed else None,
+                "total_r": round(sum(closed), 3),
+            }
+        )
+    return rows
+
+
+# --- Command Line Interface ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Score the stored setups against local OHLC history."
+    )
+    parser.add_argument("--symbol", help="Symbol without exchange, e.g. GBPUSD")
+    parser.add_argument("--model")
+    parser.add_argument("--run-id", help="Run ID or 'latest'")
+    parser.add_argument("--since", help="ISO date or time, e.g. 2026-07-01")
+    parser.add_argument("--until", help="ISO date or time, exclusive")
+    parser.add_argument(
+        "--by", choices=tuple(GROUP_KEYS), default="model", help="Group the results"
+    )
+    parser.add_argument(
+        "--trades", action="store_true", help="List every setup with its outcome"
+    )
+    parser.add_argument("--format", choices=("table", "csv", "json"), default="table")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not store_enabled():
+        print_status("RESULTS_DB is empty, there are no setups to evaluate")
+        return 1
+
+    run_id = get_latest_run_id() if args.run_id == "latest" else args.run_id
+    setups = get_setups(
+        symbol=args.symbol,
+        model=args.model,
+        run_id=run_id,
+        since=args.since,
+        until=args.until,
+    )
+    if not setups:
+        print_status("No matching trade setups")
+        return 1
+
+    start = time.perf_counter()
+    evaluate_setups(setups)
+    print_status(
+        f"Scored {len(setups)} setups of "
+        f"{len({setup['symbol'] for setup in setups})} symbols in "
+        f"{time.perf_counter() - start:.2f} s"
+    )
+
+    if args.trades:
+        columns = ("created_at", "symbol", "model", "direction", "entry")
+        rows = [
+            {
+                **{column: setup[column] for column in columns},
+                "stop_loss": setup["stop_loss"],
+                "take_profit": setup["take_profit"],
+                "outcome": setup["outcome"],
+                "r": setup["r"],
+            }
+            for setup in setups
+        ]
+    else:
+        rows = summarize_outcomes(setups, args.by)
+    print_rows(rows, args.format)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import nullcontext
+
+from helper_func import print_status
+
+# Marker put on a stage queue once per worker when the upstream stage is finished
+STOP = object()
+
+# Seconds a worker waits on its queue before looking for retries again
+POLL_INTERVAL = 0.1
+
+# Seconds a pool worker waits before opening its resource again after a failure
+REOPEN_DELAY = 5
+
+
+class Stage:
+    def __init__(
+        self,
+        name,
+        handler,
+        workers=1,
+        queue_size=1,
+        worker_context=None,
+        retries=0,
+    ):
+        # handler(item, context) returns the item handed to the next stage,
+        # worker_context() returns a context manager entered once per worker thread
+        # and failed items are retried up to `retries` times on another worker
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.worker_context = worker_context or nullcontext
+        self.retries = max(0, int(retries))
+
+
+class StageState:
+    def __init__(self, stage):
+        self.condition = threading.Condition()
+        # Entries of (item, attempt, workers the item failed on)
+        self.retries = []
+        # Workers still reading their queue or handling a retry
+        self.busy = stage.workers
+
+    def take_retry(self, worker, force=False):
+        for index, (_item, _attempt, failed_on) in enumerate(self.retries):
+            if force or worker not in failed_on:
+                return self.retries.pop(index)
+        return None
+
+
+class Pipeline:
+    def __init__(self, stages, on_item_done=None, on_item_failed=None):
+        # on_item_done(result) gets the result of the last stage,
+        # on_item_failed(item, error) the input of a stage that gave up on it
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = stages
+        self.on_item_done = on_item_done
+        self.on_item_failed = on_item_failed
+        self.results = []
+        self._results_lock = threading.Lock()
+
+    def run(self, items):
+        # Bounded queues between the stages provide the backpressure: a stage
+        # blocks on put() while the next stage is still busy with earlier items
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        states = [StageState(stage) for stage in self.stages]
+        remaining_workers = [stage.workers for stage in self.stages]
+        counter_lock = threading.Lock()
+        threads = []
+        feed_errors = []
+
+        def feed():
+            # The stop markers are sent even when the items fail, the error is
+            # raised by run() once the items already fed are done
+            try:
+                for item in items:
+                    queues[0].put(item)
+            except Exception as e:
+                feed_errors.append(e)
+            finally:
+                for _ in range(self.stages[0].workers):
+                    queues[0].put(STOP)
+
+        def finish_worker(index):
+            with counter_lock:
+                remaining_workers[index] -= 1
+                last_worker = remaining_workers[index] == 0
+            if not last_worker:
+                return
+            for item, _attempt, _failed_on in states[index].retries:
+                print_status(f"Stage '{self.stages[index].name}' skipped {item}")
+                self._item_failed(item, "no worker left to retry it")
+            if index + 1 < len(self.stages):
+                for _ in range(self.stages[index + 1].workers):
+                    queues[index + 1].put(STOP)
+
+        def work(index, worker):
+            stage = self.stages[index]
+            state = states[index]
+            stopped = False
+            try:
+                with stage.worker_context() as context:
+                    stopped = self._process(index, worker, context, queues, state)
+            except Exception as e:
+                print_status(f"Stage '{stage.name}' worker failed: {e}")
+                if not stopped:
+                    # Hand the remaining items to the other workers and keep
+                    # reading until this worker's stop marker so upstream
+                    # stages are not blocked forever
+                    while (item := queues[index].get()) is not STOP:
+                        self._add_retry(state, item, 1, {worker})
+                    with state.condition:
+                        state.busy -= 1
+                        state.condition.notify_all()
+            finally:
+                finish_worker(index)
+
+        threads.append(threading.Thread(target=feed, name="pipeline-feed", daemon=True))
+        for index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                threads.append(
+                    threading.Thread(
+                        target=work,
+                        args=(index, worker),
+                        name=f"pipeline-{stage.name}-{worker}",
+                        daemon=True,
+                    )
+                )
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if feed_errors:
+            raise feed_errors[0]
+        return self.results
+
+    def _process(self, index, worker, context, queues, state):
+        # Until the stop marker arrives retries are taken first, then new items
+        while True:
+            with state.condition:
+                entry = state.take_retry(worker)
+            if entry is not None:
+                self._handle(index, worker, context, queues, state, *entry)
+                continue
+
+            try:
+                item = queues[index].get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if item is STOP:
+                break
+            self._handle(index, worker, context, queues, state, item, 1, set())
+
+        # Retries can still come from workers that are busy, once nobody is
+        # busy any idle worker takes the remaining ones
+        with state.condition:
+            state.busy -= 1
+            state.condition.notify_all()
+
+        while True:
+            with state.condition:
+                while True:
+                    entry = state.take_retry(worker, force=state.busy == 0)
+                    if entry is not None:
+                        state.busy += 1
+                        break
+                    if state.busy == 0:
+                        return True
+                    state.condition.wait(POLL_INTERVAL)
+
+            try:
+                self._handle(index, worker, context, queues, state, *entry)
+            finally:
+                with state.condition:
+                    state.busy -= 1
+                    state.condition.notify_all()
+
+    def _item_failed(self, item, error):
+        if self.on_item_failed:
+            self.on_item_failed(item, error)
+
+    def _add_retry(self, state, item, attempt, failed_on):
+        with state.condition:
+            state.retries.append((item, attempt, failed_on))
+            state.condition.notify_all()
+
+    def _handle(self, index, worker, context, queues, state, item, attempt, failed_on):
+        stage = self.stages[index]
+        try:
+            result = stage.handler(item, context)
+        except Exception as e:
+            if attempt <= stage.retries:
+                print_status(
+                    f"Stage '{stage.name}' failed for {item}: {e}, retrying "
+                    f"on another worker"
+                )
+                self._add_retry(state, item, attempt + 1, failed_on | {worker})
+            else:
+                print_status(f"Stage '{stage.name}' failed for {item}: {e}")
+                self._item_failed(item, e)
+            return
+
+        if index + 1 == len(self.stages):
+            with self._results_lock:
+                self.results.append(result)
+            if self.on_item_done:
+                self.on_item_done(result)
+        else:
+            queues[index + 1].put(result)
+
+
+class ResourcePool:
+    def __init__(self, worker_context, workers=1, name="pool"):
+        # Threads that keep the resource of worker_context() open between
+        # calls, for resources bound to the thread that created them such as
+        # Playwright pages. A call that fails makes its worker reopen the resource
+        self.worker_context = worker_context
+        self.workers = max(1, int(workers))
+        self.name = name
+        self.open_resources = 0
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{name}-{worker}", daemon=True)
+            for worker in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn, *args):
+        # fn(*args, resource) runs on one of the pool's threads
+        future = Future()
+        self._jobs.put((future, fn, args))
+        return future
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    def close(self):
+        self._closed.set()
+        for _ in self._threads:
+            self._jobs.put(STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while not self._closed.is_set():
+            try:
+                with self.worker_context() as resource:
+                    with self._lock:
+                        self.open_resources += 1
+                    try:
+                        if not self._serve(resource):
+                            return
+                    finally:
+                        with self._lock:
+                            self.open_resources -= 1
+            except Exception as e:
+                print_status(f"Pool '{self.name}' worker failed: {e}")
+                # Fail one waiting call so callers never wait on a resource
+                # that cannot be opened
+                job = self._jobs.get()
+                if job is STOP:
+                    return
+                job[0].set_exception(e)
+                self._closed.wait(REOPEN_DELAY)
+
+    def _serve(self, resource):
+        # Returns False once the pool is closed, True to reopen the resource
+        while True:
+            job = self._jobs.get()
+            if job is STOP:
+                return False
+            future, fn, args = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, resource))
+            except Exception as e:
+                future.set_exception(e)
+                return True
@@ -0,0 +1,322 @@
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+
+from decouple import config
+
+from helper_func import print_status
+from instrumentation import Counters
+
+# Deadline in seconds for a model request including its retries and hedges,
+# it starts once the first attempt got its concurrency slot, per model with
+# MODEL_DEADLINES, e.g. '{"openai/o1": 600}'
+default_deadline = float(config("DEFAULT_MODEL_DEADLINE", default=240))
+try:
+    model_deadlines = json.loads(config("MODEL_DEADLINES", default="{}"))
+    if not isinstance(model_deadlines, dict):
+        raise ValueError("MODEL_DEADLINES is not a valid JSON object")
+except Exception as e:
+    print_status(f"Error loading or parsing MODEL_DEADLINES from .env: {e}")
+    model_deadlines = {}
+
+# Retries of 429, 5xx, timeouts and connection errors with exponential backoff
+# and full jitter, a Retry-After header of the response takes precedence
+retry_max_attempts = int(config("RETRY_MAX_ATTEMPTS", default=4))
+retry_base_delay = float(config("RETRY_BASE_DELAY", default=1.0))
+retry_max_delay = float(config("RETRY_MAX_DELAY", default=30.0))
+
+# A duplicate request is sent when the first one takes longer than this
+# percentile of the model's recent latencies, 0 disables hedging
+hedge_percentile = float(config("HEDGE_PERCENTILE", default=0.95))
+hedge_min_samples = int(config("HEDGE_MIN_SAMPLES", default=10))
+
+# A model that failed this many requests in a row is skipped for the cooldown
+circuit_failure_threshold = int(config("CIRCUIT_FAILURE_THRESHOLD", default=5))
+circuit_cooldown = float(config("CIRCUIT_COOLDOWN", default=300))
+
+LATENCY_WINDOW = 50
+# Seconds between two checks whether a request waiting for its slot was sent
+SLOT_POLL_INTERVAL = 0.05
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+executor_stats = Counters(
+    "requests",
+    "attempts",
+    "retries",
+    "hedges",
+    "hedge_wins",
+    "deadline_exceeded",
+    "circuit_rejected",
+)
+# The latency history and the circuits carry over, they describe the models
+latency_history = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+circuits = {}
+
+_lock = threading.Lock()
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="model-request")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class SlotTimeout(DeadlineExceeded):
+    # The deadline ran out while waiting for a slot, the model is not to blame
+    pass
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class Deadline:
+    # Starts when the first attempt of a request got its slot, the time spent
+    # queueing behind other requests does not count against the model
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.end = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.end is None:
+                self.end = time.monotonic() + self.seconds
+
+    def remaining(self):
+        if self.end is None:
+            return self.seconds
+        return max(0.0, self.end - time.monotonic())
+
+    def wait_timeout(self):
+        # None waits without a limit until the deadline started
+        return None if self.end is None else self.remaining()
+
+    def expired(self):
+        return self.end is not None and time.monotonic() >= self.end
+
+
+def get_deadline(model):
+    return float(model_deadlines.get(model, default_deadline))
+
+
+def is_model_available(model):
+    with _lock:
+        circuit = circuits.get(model)
+        return circuit is None or circuit["open_until"] <= time.monotonic()
+
+
+def record_success(model, latency):
+    with _lock:
+        latency_history[model].append(latency)
+        circuits.pop(model, None)
+
+
+def record_failure(model):
+    with _lock:
+        circuit = circuits.setdefault(model, {"failures": 0, "open_until": 0.0})
+        circuit["failures"] += 1
+        if circuit["failures"] >= circuit_failure_threshold:
+            circuit["open_until"] = time.monotonic() + circuit_cooldown
+            # After the cooldown a single failure opens the circuit again
+            circuit["failures"] = circuit_failure_threshold - 1
+            print_status(
+                f"Model {model} failed {circuit_failure_threshold} times in a row, "
+                f"skipping it for {circuit_cooldown:.0f} s"
+            )
+
+
+def get_hedge_delay(model):
+    if hedge_percentile <= 0:
+        return None
+    with _lock:
+        latencies = sorted(latency_history[model])
+    if len(latencies) < hedge_min_samples:
+        return None
+    index = min(len(latencies) - 1, int(hedge_percentile * len(latencies)))
+    return latencies[index]
+
+
+def is_retryable(error):
+    # openai is already loaded once a request failed
+    import openai
+
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def get_retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def get_backoff_delay(attempt):
+    return random.uniform(0, min(retry_max_delay, retry_base_delay * 2**attempt))
+
+
+def timed_attempt(model, request, deadline, slot, sent, answered):
+    # Every attempt and hedge holds its own concurrency slot while it is sent,
+    # a hedge that only gets its slot after the answer arrived is not sent
+    with slot():
+        if answered.is_set():
+            return None
+        deadline.start()
+        timeout = deadline.remaining()
+        if timeout <= 0:
+            raise SlotTimeout(f"No slot for {model} within its deadline")
+        sent.set()
+        executor_stats.count("attempts")
+        start = time.monotonic()
+        result = request(timeout)
+        record_success(model, time.monotonic() - start)
+        # Set before the slot is released, a waiting hedge takes it right away
+        answered.set()
+    return result
+
+
+def wait_until_sent(future, sent, deadline):
+    while not sent.wait(SLOT_POLL_INTERVAL):
+        if future.done() or deadline.expired():
+            return
+
+
+def hedged_attempt(model, request, deadline, slot):
+    # The first request gets a duplicate once it is slower than the model's
+    # usual latency, the first successful response wins
+    if deadline.expired():
+        raise DeadlineExceeded(f"No time left for {model} within its deadline")
+    sent = threading.Event()
+    answered = threading.Event()
+    try:
+        return wait_for_attempts(model, request, deadline, slot, sent, answered)
+    finally:
+        answered.set()
+
+
+def wait_for_attempts(model, request, deadline, slot, sent, answered):
+    futures = [
+        _pool.submit(timed_attempt, model, request, deadline, slot, sent, answered)
+    ]
+    hedge_delay = get_hedge_delay(model)
+    if hedge_delay is not None:
+        # Time spent waiting for a slot does not count as latency
+        wait_until_sent(futures[0], sent, deadline)
+    if hedge_delay is not None and hedge_delay < deadline.remaining():
+        done, _pending = wait(futures, timeout=hedge_delay)
+        if not done and not deadline.expired():
+            executor_stats.count("hedges")
+            futures.append(
+                _pool.submit(
+                    timed_attempt,
+                    model,
+                    request,
+                    deadline,
+                    slot,
+                    threading.Event(),
+                    answered,
+                )
+            )
+
+    error = None
+    pending = set(futures)
+    while pending:
+        done, pending = wait(
+            pending,
+            timeout=deadline.wait_timeout(),
+            return_when=FIRST_COMPLETED,
+        )
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                if future is not futures[0]:
+                    executor_stats.count("hedge_wins")
+                return future.result()
+            error = future.exception()
+    if error is not None and not pending:
+        raise error
+    if not sent.is_set():
+        raise SlotTimeout(f"No slot for {model} within its deadline")
+    raise DeadlineExceeded(f"No response from {model} within its deadline")
+
+
+def execute_request(model, request, slot=nullcontext):
+    # request(timeout) sends one request and returns its response, it is
+    # retried and hedged until the model's deadline. slot() returns the context
+    # manager of a concurrency slot, it is held by every attempt and hedge
+    # while it is sent and released during the backoff between retries, the
+    # deadline starts once the first attempt got its slot
+    executor_stats.count("requests")
+    if not is_model_available(model):
+        executor_stats.count("circuit_rejected")
+        raise CircuitOpen(f"Model {model} is skipped after repeated failures")
+
+    deadline = Deadline(get_deadline(model))
+    attempt = 0
+    while True:
+        try:
+            return hedged_attempt(model, request, deadline, slot)
+        except SlotTimeout:
+            executor_stats.count("deadline_exceeded")
+            raise
+        except DeadlineExceeded:
+            executor_stats.count("deadline_exceeded")
+            record_failure(model)
+            raise
+        except Exception as e:
+            attempt += 1
+            if not is_retryable(e) or attempt >= retry_max_attempts:
+                record_failure(model)
+                raise
+            delay = get_retry_after(e)
+            if delay is None:
+                delay = get_backoff_delay(attempt - 1)
+            if delay >= deadline.remaining():
+                executor_stats.count("deadline_exceeded")
+                record_failure(model)
+                raise DeadlineExceeded(
+                    f"Retry of {model} would exceed its deadline: {e}"
+                ) from e
+            executor_stats.count("retries")
+            print_status(
+                f"Request to {model} failed ({e.__class__.__name__}), "
+                f"retrying in {delay:.1f} s"
+            )
+            time.sleep(delay)
+
+
+def print_executor_stats():
+    if not executor_stats["requests"]:
+        return
+    print_status(
+        f"Model requests: {executor_stats['requests']} requests, "
+        f"{executor_stats['attempts']} attempts, {executor_stats['retries']} retries, "
+        f"{executor_stats['hedges']} hedges ({executor_stats['hedge_wins']} won), "
+        f"{executor_stats['deadline_exceeded']} past deadline, "
+        f"{executor_stats['circuit_rejected']} skipped by open circuits"
+    )
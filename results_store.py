@@ -0,0 +1,382 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+from decouple import config
+
+from helper_func import (
+    check_if_directory_exists,
+    now_iso,
+    print_status,
+    text_sha256,
+    to_number,
+)
+
+# SQLite database holding every setup and summary, empty disables the store
+results_db = config("RESULTS_DB", default="results.sqlite3")
+
+SUMMARY_FIELDS = (
+    "direction",
+    "entry",
+    "stop_loss",
+    "take_profit",
+    "rrr",
+    "stop_loss_pips",
+    "take_profit_pips",
+)
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens", "cost")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    symbols TEXT NOT NULL,
+    timeframes TEXT NOT NULL,
+    models TEXT NOT NULL,
+    wall_seconds REAL
+);
+CREATE TABLE IF NOT EXISTS setups (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    model TEXT NOT NULL,
+    setup_name TEXT NOT NULL,
+    timeframes TEXT NOT NULL,
+    setup_sha256 TEXT NOT NULL,
+    setup_text TEXT NOT NULL,
+    cached INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    total_tokens INTEGER,
+    cost REAL
+);
+CREATE INDEX IF NOT EXISTS setups_symbol ON setups (symbol, created_at);
+CREATE INDEX IF NOT EXISTS setups_model ON setups (model, created_at);
+CREATE INDEX IF NOT EXISTS setups_run ON setups (run_id);
+CREATE INDEX IF NOT EXISTS setups_sha256 ON setups (setup_sha256);
+CREATE TABLE IF NOT EXISTS summaries (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    model TEXT NOT NULL,
+    setup_name TEXT NOT NULL,
+    setup_sha256 TEXT NOT NULL,
+    source TEXT NOT NULL,
+    direction TEXT,
+    entry REAL,
+    stop_loss REAL,
+    take_profit REAL,
+    rrr REAL,
+    stop_loss_pips REAL,
+    take_profit_pips REAL
+);
+CREATE INDEX IF NOT EXISTS summaries_symbol ON summaries (symbol, created_at);
+CREATE INDEX IF NOT EXISTS summaries_model ON summaries (model, created_at);
+CREATE INDEX IF NOT EXISTS summaries_direction ON summaries (direction, symbol);
+CREATE INDEX IF NOT EXISTS summaries_run ON summaries (run_id, symbol);
+"""
+
+# Rows are collected while a symbol is processed and written in one
+# transaction, a single connection never sees more than one writer thread
+_pending_setups = []
+_pending_summaries = []
+_lock = threading.Lock()
+
+
+def store_enabled():
+    return bool(results_db)
+
+
+@contextmanager
+def connect():
+    # Commits on success, rolls back on error and always closes the connection
+    directory = os.path.dirname(results_db)
+    if directory:
+        check_if_directory_exists(directory)
+    connection = sqlite3.connect(results_db, timeout=30)
+    try:
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def begin_run(run_id, symbols, timeframes, models):
+    if not store_enabled():
+        return
+    with _lock, connect() as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO runs (run_id, started_at, symbols, timeframes, "
+            "models) VALUES (?, ?, ?, ?, ?)",
+            (
+                run_id,
+                now_iso(),
+                json.dumps(symbols),
+                json.dumps(timeframes),
+                json.dumps(models),
+            ),
+        )
+
+
+def finish_run(run_id, wall_seconds=None):
+    if not store_enabled():
+        return
+    flush_results()
+    with _lock, connect() as connection:
+        connection.execute(
+            "UPDATE runs SET finished_at = ?, wall_seconds = ? WHERE run_id = ?",
+            (now_iso(), wall_seconds, run_id),
+        )
+
+
+def add_setup(
+    run_id, symbol, model, setup_name, timeframes, text, usage=None, cached=False
+):
+    if not store_enabled():
+        return
+    usage = usage or {}
+    row = (
+        run_id,
+        now_iso(),
+        symbol,
+        model,
+        setup_name,
+        json.dumps(timeframes),
+        text_sha256(text),
+        text,
+        int(cached),
+        *(usage.get(field) for field in USAGE_FIELDS),
+    )
+    with _lock:
+        _pending_setups.append(row)
+
+
+def add_summary(run_id, symbol, model, setup_name, text, summary, source):
+    if not store_enabled():
+        return
+    row = (
+        run_id,
+        now_iso(),
+        symbol,
+        model,
+        setup_name,
+        text_sha256(text),
+        source,
+        summary.get("direction"),
+        *(to_number(summary.get(field)) for field in SUMMARY_FIELDS[1:]),
+    )
+    with _lock:
+        _pending_summaries.append(row)
+
+
+def flush_results():
+    if not store_enabled():
+        return
+    with _lock:
+        if not _pending_setups and not _pending_summaries:
+            return
+        with connect() as connection:
+            connection.executemany(
+                "INSERT INTO setups (run_id, created_at, symbol, model, setup_name, "
+                "timeframes, setup_sha256, setup_text, cached, prompt_tokens, "
+                "completion_tokens, total_tokens, cost) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                _pending_setups,
+            )
+            connection.executemany(
+                "INSERT INTO summaries (run_id, created_at, symbol, model, setup_name, "
+                "setup_sha256, source, direction, entry, stop_loss, take_profit, rrr, "
+                "stop_loss_pips, take_profit_pips) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                _pending_summaries,
+            )
+        _pending_setups.clear()
+        _pending_summaries.clear()
+
+
+def build_filters(
+    symbol=None, model=None, direction=None, run_id=None, since=None, until=None
+):
+    clauses = []
+    params = []
+    for column, value in (
+        ("symbol", symbol),
+        ("model", model),
+        ("direction", direction),
+        ("run_id", run_id),
+    ):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append("created_at < ?")
+        params.append(until)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+
+def query_summaries(limit=None, **filters):
+    # Filters: symbol, model, direction, run_id and since/until as ISO dates
+    where, params = build_filters(**filters)
+    sql = f"SELECT * FROM summaries{where} ORDER BY created_at, id"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    with connect() as connection:
+        rows = [dict(row) for row in connection.execute(sql, params)]
+    for row in rows:
+        # Same shape as the summaries built during a run
+        row["filename"] = row["setup_name"]
+    return rows
+
+
+def query_setups(limit=None, include_text=False, **filters):
+    filters.pop("direction", None)
+    where, params = build_filters(**filters)
+    columns = (
+        "*"
+        if include_text
+        else (
+            "id, run_id, created_at, symbol, model, setup_name, timeframes, "
+            "setup_sha256, cached, prompt_tokens, completion_tokens, total_tokens, cost"
+        )
+    )
+    sql = f"SELECT {columns} FROM setups{where} ORDER BY created_at, id"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    with connect() as connection:
+        return [dict(row) for row in connection.execute(sql, params)]
+
+
+def query_runs(limit=None):
+    sql = "SELECT * FROM runs ORDER BY started_at DESC"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    with connect() as connection:
+        return [dict(row) for row in connection.execute(sql)]
+
+
+def get_latest_run_id():
+    runs = query_runs(limit=1)
+    return runs[0]["run_id"] if runs else None
+
+
+# --- Command Line Interface ---
+def print_rows(rows, output_format):
+    if output_format == "json":
+        print(json.dumps(rows, indent=2, default=str))
+        return
+    if not rows:
+        print_status("No matching rows")
+        return
+    columns = [column for column in rows[0] if column != "filename"]
+    if output_format == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+        return
+    widths = {
+        column: max(len(column), *(len(str(row[column])) for row in rows))
+        for column in columns
+    }
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row[column]).ljust(widths[column]) for column in columns))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Query the trading setups and summaries of previous runs."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_filters(command, with_direction=True):
+        command.add_argument("--symbol", help="Symbol without exchange, e.g. GBPUSD")
+        command.add_argument("--model")
+        if with_direction:
+            command.add_argument("--direction", help="Long, Short or None")
+        command.add_argument("--run-id", help="Run ID or 'latest'")
+        command.add_argument("--since", help="ISO date or time, e.g. 2026-10-01")
+        command.add_argument("--until", help="ISO date or time, exclusive")
+
+    def add_output(command):
+        command.add_argument("--limit", type=int)
+        command.add_argument(
+            "--format", choices=("table", "csv", "json"), default="table"
+        )
+
+    summaries = commands.add_parser("summaries", help="List parsed summaries")
+    add_filters(summaries)
+    add_output(summaries)
+
+    setups = commands.add_parser("setups", help="List raw setups")
+    add_filters(setups, with_direction=False)
+    add_output(setups)
+    setups.add_argument("--text", action="store_true", help="Include the setup text")
+
+    runs = commands.add_parser("runs", help="List runs")
+    add_output(runs)
+
+    export = commands.add_parser("export", help="Export summaries to Excel")
+    add_filters(export)
+    export.add_argument("--output", required=True, help="Path of the .xlsx file")
+    return parser.parse_args(argv)
+
+
+def get_filters(args):
+    run_id = args.run_id
+    if run_id == "latest":
+        run_id = get_latest_run_id()
+    return {
+        "symbol": args.symbol,
+        "model": args.model,
+        "direction": getattr(args, "direction", None),
+        "run_id": run_id,
+        "since": args.since,
+        "until": args.until,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not store_enabled():
+        print_status("RESULTS_DB is empty, the results store is disabled")
+        return 1
+
+    if args.command == "runs":
+        print_rows(query_runs(args.limit), args.format)
+    elif args.command == "setups":
+        rows = query_setups(args.limit, include_text=args.text, **get_filters(args))
+        print_rows(rows, args.format)
+    elif args.command == "summaries":
+        print_rows(query_summaries(args.limit, **get_filters(args)), args.format)
+    else:
+        from excel_export import write_summaries_workbook
+
+        summaries = query_summaries(**get_filters(args))
+        sheets = {}
+        for summary in summaries:
+            sheets.setdefault(summary["symbol"], []).append(summary)
+        if not sheets:
+            print_status("No matching summaries, nothing exported")
+            return 1
+        write_summaries_workbook(args.output, sheets)
+        print_status(f"{len(summaries)} summaries exported to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
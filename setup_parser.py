@@ -0,0 +1,174 @@
+import json
+import re
+
+from decouple import config
+
+from helper_func import print_status
+from instrumentation import Counters
+
+# Pip size per instrument, e.g. '{"XAUUSD": 0.1}', overrides the defaults below
+try:
+    pip_sizes = json.loads(config("PIP_SIZES", default="{}"))
+    if not isinstance(pip_sizes, dict):
+        raise ValueError("PIP_SIZES is not a valid JSON object")
+except Exception as e:
+    print_status(f"Error loading or parsing PIP_SIZES from .env: {e}")
+    pip_sizes = {}
+
+DEFAULT_PIP_SIZES = {"XAU": 0.1, "XAG": 0.01}
+DEFAULT_PIP_SIZE = 0.0001
+JPY_PIP_SIZE = 0.01
+
+# Labels of the "Trading Setup:" block required by TRADING_USER_PROMPT
+FIELD_LABELS = {
+    "direction": "direction",
+    "entry price": "entry",
+    "entry": "entry",
+    "stop loss": "stop_loss",
+    "take profit": "take_profit",
+    "risk/reward ratio": "rrr",
+    "risk reward ratio": "rrr",
+}
+
+SETUP_HEADING = re.compile(r"^trading setup\s*:?\s*$", re.IGNORECASE)
+SECTION_END = re.compile(r"^rationale\s*:?", re.IGNORECASE)
+FIELD_LINE = re.compile(r"^([a-z/ ]+?)\s*:\s*(.*)$", re.IGNORECASE)
+PRICE_LEVELS = re.compile(r"entry price|stop loss\W*:|take profit\W*:", re.IGNORECASE)
+NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+NO_SETUP = re.compile(
+    r"\bno\s+(?:valid\s+|clear\s+|actionable\s+|high[- ]probability\s+)*"
+    r"(?:trading\s+|trade\s+)?setups?\b"
+    r"|\bnot?\s+(?:be\s+)?(?:able\s+to\s+)?identif(?:y|ied)\b"
+    r"|\bdo(?:es)?\s+not\s+(?:meet|qualify)\b",
+    re.IGNORECASE,
+)
+
+parser_stats = Counters("parsed", "no_setup", "fallback")
+
+
+def get_pip_size(symbol):
+    instrument = symbol.split(":")[-1].upper()
+    if instrument in pip_sizes:
+        return float(pip_sizes[instrument])
+    for prefix, size in DEFAULT_PIP_SIZES.items():
+        if instrument.startswith(prefix):
+            return size
+    if "JPY" in instrument:
+        return JPY_PIP_SIZE
+    return DEFAULT_PIP_SIZE
+
+
+def clean_line(line):
+    # Drop markdown emphasis and list bullets around the labels
+    line = re.sub(r"[*_`#]", "", line).strip()
+    return line.lstrip("-•> ").strip()
+
+
+def parse_price(value):
+    # Justifications follow in brackets, more than one price before them means
+    # a range or several targets, which is left to the LLM
+    numbers = NUMBER.findall(value.split("(")[0])
+    if len(numbers) != 1:
+        return None
+    return float(numbers[0].replace(",", ""))
+
+
+def extract_setup_fields(text):
+    lines = [clean_line(line) for line in text.splitlines()]
+    headings = [index for index, line in enumerate(lines) if SETUP_HEADING.match(line)]
+    if len(headings) != 1:
+        return None
+
+    fields = {}
+    for line in lines[headings[0] + 1 :]:
+        if SECTION_END.match(line):
+            break
+        match = FIELD_LINE.match(line)
+        if not match:
+            continue
+        key = FIELD_LABELS.get(match.group(1).strip().lower())
+        if key is None:
+            continue
+        if key in fields:
+            # Several setups in one block
+            return None
+        fields[key] = match.group(2).strip()
+    return fields
+
+
+def empty_summary():
+    # Same shape SUMMARY_SYSTEM_PROMPT asks the LLM for when there is no setup
+    return {
+        "direction": "None",
+        "entry": 0,
+        "stop_loss": 0,
+        "take_profit": 0,
+        "rrr": 0,
+        "stop_loss_pips": 0,
+        "take_profit_pips": 0,
+    }
+
+
+def parse_trading_setup(text, symbol):
+    # Returns the summary dict or None when the LLM has to extract the values
+    fields = extract_setup_fields(text)
+
+    if fields is None:
+        # An explicit verdict without any price levels is the honesty clause
+        if not PRICE_LEVELS.search(text) and NO_SETUP.search(text):
+            parser_stats.count("no_setup")
+            return empty_summary()
+        parser_stats.count("fallback")
+        return None
+
+    direction_match = re.match(r"(long|short)\b", fields.get("direction", ""), re.I)
+    prices = {
+        key: parse_price(fields.get(key, ""))
+        for key in ("entry", "stop_loss", "take_profit")
+    }
+    if direction_match is None or None in prices.values():
+        parser_stats.count("fallback")
+        return None
+
+    direction = direction_match.group(1).capitalize()
+    entry, stop_loss, take_profit = (
+        prices["entry"],
+        prices["stop_loss"],
+        prices["take_profit"],
+    )
+
+    # Levels on the wrong side of the entry mean the text was misread
+    if direction == "Long":
+        valid = stop_loss < entry < take_profit
+    else:
+        valid = take_profit < entry < stop_loss
+    if not valid:
+        parser_stats.count("fallback")
+        return None
+
+    pip_size = get_pip_size(symbol)
+    risk = abs(entry - stop_loss)
+    reward = abs(take_profit - entry)
+
+    parser_stats.count("parsed")
+    return {
+        "direction": direction,
+        "entry": entry,
+        "stop_loss": stop_loss,
+        "take_profit": take_profit,
+        "rrr": round(reward / risk, 2),
+        "stop_loss_pips": round(risk / pip_size, 1),
+        "take_profit_pips": round(reward / pip_size, 1),
+    }
+
+
+def print_parser_stats():
+    total = sum(parser_stats.values())
+    if not total:
+        return
+    hits = parser_stats["parsed"] + parser_stats["no_setup"]
+    print_status(
+        f"Setup parser: {hits}/{total} parsed locally ({hits / total:.0%}), "
+        f"{parser_stats['no_setup']} without setup, "
+        f"{parser_stats['fallback']} sent to the LLM"
+    )
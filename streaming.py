@@ -0,0 +1,218 @@
+import os
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+from decouple import config
+
+from helper_func import print_status
+from instrumentation import Counters
+from setup_parser import (
+    NO_SETUP,
+    PRICE_LEVELS,
+    SECTION_END,
+    SETUP_HEADING,
+    clean_line,
+    extract_setup_fields,
+)
+
+# Trading setups are streamed token by token and written to a .partial file
+# next to the setup while they arrive, the file of a stream that fails is kept
+# to see how far the model got
+stream_completions = config("STREAM_COMPLETIONS", default=False, cast=bool)
+# When a stream is stopped before the model is done:
+# "off" never, "no_setup" after an explicit no-setup verdict, "setup" also
+# after a complete "Trading Setup:" block (its rationale is dropped)
+stream_early_stop = config("STREAM_EARLY_STOP", default="no_setup").lower()
+
+EARLY_STOP_MODES = ("off", "no_setup", "setup")
+# Rough size of a token, used for the usage of streams that were stopped
+CHARS_PER_TOKEN = 4
+COMPLETION_WINDOW = 50
+# The bullets of the analysis section weigh single timeframes, a "no setup"
+# there is not the verdict on the whole chart set
+ANALYSIS_HEADING = re.compile(r"^analysis summary\b", re.IGNORECASE)
+SECTION_HEADING = re.compile(r"^[a-z][\w &/',()-]*:$", re.IGNORECASE)
+LIST_ITEM = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s")
+# A verdict with a contrast may still be followed by a setup
+HEDGE = re.compile(
+    r"\b(?:but|however|although|though|yet|except|unless|while|that said)\b",
+    re.IGNORECASE,
+)
+
+# Samples are the times to the first content token per model
+stream_stats = Counters("streams", "setup_stops", "no_setup_stops", "tokens_saved")
+# Completion tokens of streams that ran to the end, to estimate what a stop
+# saved, they carry over from run to run
+completion_history = defaultdict(lambda: deque(maxlen=COMPLETION_WINDOW))
+
+_lock = threading.Lock()
+
+
+def complete_lines(text):
+    # The last line may still be cut in the middle of a word
+    return text[: text.rfind("\n") + 1]
+
+
+def get_stop_reason(text):
+    # Returns "setup", "no_setup" or None for the text received so far
+    text = complete_lines(text)
+    if extract_setup_fields(text) is not None:
+        # The block is complete once the rationale after it has started
+        lines = [clean_line(line) for line in text.splitlines()]
+        heading = next(i for i, line in enumerate(lines) if SETUP_HEADING.match(line))
+        if any(SECTION_END.match(line) for line in lines[heading + 1 :]):
+            return "setup"
+        return None
+
+    # A verdict counts once the model moved on to the next paragraph and no
+    # price levels were given, the same rule the setup parser applies to the
+    # whole text
+    if PRICE_LEVELS.search(text):
+        return None
+    return "no_setup" if has_final_verdict(text) else None
+
+
+def is_verdict(line):
+    sentences = re.split(r"(?<=[.!?])\s+", line)
+    return any(NO_SETUP.search(s) and not HEDGE.search(s) for s in sentences)
+
+
+def has_final_verdict(text):
+    # The analysis section runs from its heading to the first paragraph that
+    # is not a list
+    in_analysis = False
+    section = []
+    verdict = False
+    for paragraph in re.split(r"\n\s*\n", text):
+        lines = [line for line in paragraph.splitlines() if line.strip()]
+        if not lines:
+            continue
+        first = clean_line(lines[0])
+        if verdict and not (HEDGE.match(first) or SETUP_HEADING.match(first)):
+            return True
+        verdict = False
+        if in_analysis and not LIST_ITEM.match(lines[0]) and len(section) > 1:
+            in_analysis = False
+        for line in lines:
+            cleaned = clean_line(line)
+            if ANALYSIS_HEADING.match(cleaned):
+                in_analysis = True
+                section = []
+            elif SECTION_HEADING.match(cleaned):
+                in_analysis = False
+            elif not in_analysis and not LIST_ITEM.match(line) and is_verdict(cleaned):
+                verdict = True
+            if in_analysis:
+                section.append(line)
+    return False
+
+
+def should_stop(reason):
+    if reason is None or stream_early_stop == "off":
+        return False
+    return reason == "no_setup" or stream_early_stop == "setup"
+
+
+def estimate_tokens_saved(model, received_tokens):
+    with _lock:
+        history = list(completion_history[model])
+    if not history:
+        return 0
+    return max(0, round(sum(history) / len(history)) - received_tokens)
+
+
+def stream_completion(model, open_stream, partial_path=None):
+    # Consumes the chat completion stream open_stream() returns, returns
+    # (content, usage); the usage of a stopped stream is estimated from its length
+    if stream_early_stop not in EARLY_STOP_MODES:
+        raise ValueError(f"Unsupported STREAM_EARLY_STOP: {stream_early_stop}")
+    stream_stats.count("streams")
+    start = time.monotonic()
+    stream = open_stream()
+    first_token = None
+    parts = []
+    usage = None
+    stop_reason = None
+
+    # Every attempt has its own file, hedged duplicates stream in parallel
+    partial_file = None
+    if partial_path:
+        partial_path = f"{partial_path}.{uuid.uuid4().hex[:8]}.partial"
+        partial_file = open(partial_path, "w", encoding="utf-8")
+    completed = False
+    try:
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first_token is None:
+                first_token = time.monotonic() - start
+            parts.append(delta)
+            if partial_file is not None:
+                partial_file.write(delta)
+            # Only a new line can finish a block or a verdict
+            if "\n" in delta:
+                stop_reason = get_stop_reason("".join(parts))
+                if should_stop(stop_reason):
+                    break
+                stop_reason = None
+        completed = True
+    finally:
+        stream.close()
+        if partial_file is not None:
+            partial_file.close()
+            if completed:
+                os.remove(partial_path)
+            else:
+                print_status(
+                    f"Stream of {model} failed, partial setup in {partial_path}"
+                )
+
+    content = "".join(parts)
+    if first_token is not None:
+        stream_stats.add_sample(model, first_token)
+
+    if stop_reason is None:
+        if usage is not None and usage.completion_tokens:
+            with _lock:
+                completion_history[model].append(usage.completion_tokens)
+        return content, usage
+
+    received_tokens = len(content) // CHARS_PER_TOKEN
+    stream_stats.count(f"{stop_reason}_stops")
+    stream_stats.count("tokens_saved", estimate_tokens_saved(model, received_tokens))
+    return content.rstrip(), SimpleNamespace(
+        completion_tokens=received_tokens, total_tokens=received_tokens
+    )
+
+
+def get_stream_stats():
+    stats = dict(stream_stats)
+    times = sorted(
+        value for values in stream_stats.get_samples().values() for value in values
+    )
+    if times:
+        stats["ttft_p50"] = round(times[len(times) // 2], 3)
+        stats["ttft_p95"] = round(times[min(len(times) - 1, int(len(times) * 0.95))], 3)
+    return stats
+
+
+def print_stream_stats():
+    stats = get_stream_stats()
+    if not stats["streams"]:
+        return
+    print_status(
+        f"Streams: {stats['streams']} streams, first token p50 "
+        f"{stats.get('ttft_p50', 0):.2f} s, p95 {stats.get('ttft_p95', 0):.2f} s, "
+        f"stopped {stats['no_setup_stops']} after no-setup verdicts and "
+        f"{stats['setup_stops']} after setup blocks, "
+        f"~{stats['tokens_saved']} completion tokens saved"
+    )
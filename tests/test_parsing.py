@@ -0,0 +1,167 @@
+import json
+
+import pytest
+
+from batch_summary import parse_batch_response
+from setup_parser import empty_summary, parse_trading_setup
+from streaming import get_stop_reason
+
+SETUP_TEXT = """Instrument: GBPUSD
+Analysis Timeframes Provided: Daily, H4, H1
+
+**Analysis Summary & Confluence:**
+*   Daily uptrend with higher highs and higher lows.
+*   H4 demand zone at 1.2650 holds.
+
+**Trading Setup:**
+Direction: Long
+Entry Order Type: Buy Limit
+Entry Price: 1.2660
+Stop Loss: 1.2610 (Justification: Below the H4 demand zone)
+Take Profit: 1.2785 (Justification: Daily resistance)
+Risk/Reward Ratio: 2.5:1
+
+**Rationale:**
+The pullback into the H4 demand zone lines up with the daily trend.
+"""
+
+NO_SETUP_TEXT = """After reviewing all timeframes, no valid trading setup meets the criteria.
+
+The market is ranging with conflicting signals across timeframes.
+"""
+
+
+# --- parse_trading_setup ---
+def test_parses_setup_block():
+    assert parse_trading_setup(SETUP_TEXT, "FX:GBPUSD") == {
+        "direction": "Long",
+        "entry": 1.266,
+        "stop_loss": 1.261,
+        "take_profit": 1.2785,
+        "rrr": 2.5,
+        "stop_loss_pips": 50.0,
+        "take_profit_pips": 125.0,
+    }
+
+
+def test_uses_jpy_pip_size():
+    text = SETUP_TEXT.replace("Long", "Short").replace("Buy Limit", "Sell Limit")
+    text = (
+        text.replace("1.2660", "151.20")
+        .replace("1.2610", "151.70")
+        .replace("1.2785", "150.20")
+    )
+    summary = parse_trading_setup(text, "FX:USDJPY")
+    assert summary["direction"] == "Short"
+    assert summary["stop_loss_pips"] == 50.0
+    assert summary["take_profit_pips"] == 100.0
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ("Entry Price: 1.2660", "Entry Price: 1.2660 - 1.2670"),
+        ("Stop Loss: 1.2610", "Stop Loss: 1.2700"),
+        ("Direction: Long", "Direction: Either"),
+    ],
+)
+def test_leaves_ambiguous_setups_to_the_llm(old, new):
+    assert parse_trading_setup(SETUP_TEXT.replace(old, new), "FX:GBPUSD") is None
+
+
+def test_no_setup_verdict_without_levels():
+    assert parse_trading_setup(NO_SETUP_TEXT, "FX:GBPUSD") == empty_summary()
+
+
+def test_free_text_goes_to_the_llm():
+    text = "Go long at 1.2660, stop at 1.2610 and target 1.2785."
+    assert parse_trading_setup(text, "FX:GBPUSD") is None
+
+
+# --- parse_batch_response ---
+BATCH_ENTRY = {
+    "direction": "long",
+    "entry": "1,266.5",
+    "stop_loss": 1261,
+    "take_profit": 1278.5,
+    "rrr": 2.4,
+    "stop_loss_pips": 55,
+    "take_profit_pips": 120,
+}
+
+
+def test_parses_batch_in_code_fence():
+    text = (
+        '```json\n[{"filename": "a", "direction": "long", "entry": "1,266.5", '
+        '"stop_loss": 1261, "take_profit": 1278.5, "rrr": 2.4, '
+        '"stop_loss_pips": 55, "take_profit_pips": 120}]\n```'
+    )
+    assert parse_batch_response(text, {"a"}) == {
+        "a": {**BATCH_ENTRY, "direction": "Long", "entry": 1266.5}
+    }
+
+
+def test_drops_invalid_batch_entries():
+    entries = [
+        {"filename": "unknown", **BATCH_ENTRY},
+        {"filename": "a", **BATCH_ENTRY, "direction": "sideways"},
+        {"filename": "b", **BATCH_ENTRY, "rrr": "n/a"},
+        {"filename": "c", "direction": "None"},
+        {"filename": "d", **BATCH_ENTRY, "direction": "none"},
+    ]
+    summaries = parse_batch_response(json.dumps(entries), {"a", "b", "c", "d"})
+    assert list(summaries) == ["d"]
+    assert summaries["d"]["direction"] == "None"
+
+
+@pytest.mark.parametrize("text", ["not json", '{"filename": "a"}'])
+def test_rejects_malformed_batches(text):
+    assert parse_batch_response(text, {"a"}) == {}
+
+
+# --- Stream stop rules ---
+def test_stops_after_complete_setup_block():
+    assert get_stop_reason(SETUP_TEXT) == "setup"
+
+
+def test_waits_for_the_rationale():
+    text = SETUP_TEXT.split("**Rationale:**")[0]
+    assert get_stop_reason(text) is None
+
+
+def test_stops_after_no_setup_verdict():
+    assert get_stop_reason(NO_SETUP_TEXT) == "no_setup"
+
+
+def test_ignores_unfinished_lines():
+    assert get_stop_reason("No valid trading setup meets") is None
+
+
+HEDGED_VERDICT = (
+    "No clear setup on the H1 alone, but the H4 demand zone gives confluence."
+)
+
+
+def test_ignores_verdicts_in_the_analysis_section():
+    text = (
+        "**Analysis Summary & Confluence:**\n"
+        f"*   {HEDGED_VERDICT}\n"
+        "*   Daily uptrend with higher highs and higher lows.\n\n"
+        "**Trading Setup:**\n"
+    )
+    assert get_stop_reason(text) is None
+
+
+def test_ignores_hedged_verdicts():
+    text = f"{HEDGED_VERDICT}\n\nThe H4 demand zone at 1.2650 holds.\n"
+    assert get_stop_reason(text) is None
+
+
+def test_waits_for_the_next_paragraph():
+    text = NO_SETUP_TEXT.split("\n\n")[0] + "\n\n"
+    assert get_stop_reason(text) is None
+
+
+def test_verdict_followed_by_a_contrast_is_not_final():
+    text = "No valid setup on the daily.\n\nHowever, the H4 shows a clean retest.\n"
+    assert get_stop_reason(text) is None
@@ -0,0 +1,33 @@
+import pytest
+
+from pipeline import Pipeline, Stage
+
+
+def failing_items():
+    yield 1
+    raise RuntimeError("database is locked")
+
+
+def test_run_raises_feed_errors_after_the_fed_items():
+    done = []
+    pipeline = Pipeline(
+        [Stage("double", lambda item, _context: item * 2, workers=2)],
+        on_item_done=done.append,
+    )
+    with pytest.raises(RuntimeError, match="database is locked"):
+        pipeline.run(failing_items())
+    assert done == [2]
+
+
+def test_retries_failed_items_on_another_worker():
+    failures = []
+
+    def handler(item, _context):
+        if not failures:
+            failures.append(item)
+            raise ValueError("first attempt fails")
+        return item
+
+    pipeline = Pipeline([Stage("flaky", handler, workers=2, retries=1)])
+    assert pipeline.run([1]) == [1]
+    assert failures == [1]
@@ -0,0 +1,369 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from decouple import config
+
+from helper_func import (
+    check_if_directory_exists,
+    clear_symbol_directory,
+    get_download_directory,
+    now_iso,
+    print_status,
+)
+
+# SQLite database shared by the coordinator and every worker process
+work_queue_db = config("WORK_QUEUE_DB", default="work_queue.sqlite3")
+# A claimed symbol goes back to the queue when its worker stops renewing the lease
+lease_seconds = int(config("WORK_LEASE_SECONDS", default=900))
+max_attempts = int(config("WORK_MAX_ATTEMPTS", default=3))
+worker_id = config("WORKER_ID", default=f"{socket.gethostname()}-{os.getpid()}")
+
+# Seconds between two claims of a worker waiting for new jobs
+POLL_SECONDS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    batch_id TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_id TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (batch_id, symbol)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires);
+"""
+
+
+@contextmanager
+def transaction():
+    # BEGIN IMMEDIATE takes the write lock up front, so two workers never
+    # claim the same job
+    directory = os.path.dirname(work_queue_db)
+    if directory:
+        check_if_directory_exists(directory)
+    connection = sqlite3.connect(work_queue_db, timeout=60, isolation_level=None)
+    try:
+        connection.row_factory = sqlite3.Row
+        connection.executescript(SCHEMA)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    finally:
+        connection.close()
+
+
+def enqueue_batch(symbols, batch_id=None):
+    batch_id = (
+        batch_id or datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+    )
+    created = now_iso()
+    with transaction() as connection:
+        connection.executemany(
+            "INSERT OR IGNORE INTO jobs (batch_id, symbol, position, created_at, "
+            "updated_at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (batch_id, symbol, position, created, created)
+                for position, symbol in enumerate(symbols)
+            ],
+        )
+    return batch_id
+
+
+def claim_job(worker, batch_id=None):
+    # Returns (batch_id, symbol) of the next pending job or of a job whose
+    # lease expired, None when there is nothing to do
+    now = time.time()
+    batch_filter = " AND batch_id = ?" if batch_id else ""
+    batch_params = [batch_id] if batch_id else []
+    with transaction() as connection:
+        connection.execute(
+            "UPDATE jobs SET status = 'failed', error = 'lease expired', "
+            "updated_at = ? WHERE status = 'leased' AND lease_expires < ? "
+            "AND attempts >= ?" + batch_filter,
+            [now_iso(), now, max_attempts, *batch_params],
+        )
+        job = connection.execute(
+            "SELECT batch_id, symbol, status, worker FROM jobs WHERE "
+            "(status = 'pending' OR (status = 'leased' AND lease_expires < ?))"
+            + batch_filter
+            + " ORDER BY created_at, position LIMIT 1",
+            [now, *batch_params],
+        ).fetchone()
+        if job is None:
+            return None
+        if job["status"] == "leased":
+            print_status(
+                f"Lease of {job['symbol']} held by {job['worker']} expired, "
+                f"taking it over"
+            )
+        connection.execute(
+            "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, "
+            "attempts = attempts + 1, updated_at = ? WHERE batch_id = ? AND symbol = ?",
+            (worker, now + lease_seconds, now_iso(), job["batch_id"], job["symbol"]),
+        )
+    return job["batch_id"], job["symbol"]
+
+
+def renew_leases(worker, jobs):
+    # jobs are the (batch_id, symbol) the worker is still working on
+    lease_expires = time.time() + lease_seconds
+    with transaction() as connection:
+        connection.executemany(
+            "UPDATE jobs SET lease_expires = ? WHERE batch_id = ? AND symbol = ? "
+            "AND worker = ? AND status = 'leased'",
+            [(lease_expires, batch_id, symbol, worker) for batch_id, symbol in jobs],
+        )
+
+
+def complete_job(batch_id, symbol, worker, run_id):
+    with transaction() as connection:
+        updated = connection.execute(
+            "UPDATE jobs SET status = 'done', run_id = ?, error = NULL, "
+            "updated_at = ? WHERE batch_id = ? AND symbol = ? AND worker = ? "
+            "AND status = 'leased'",
+            (run_id, now_iso(), batch_id, symbol, worker),
+        ).rowcount
+    if not updated:
+        print_status(f"Lease of {symbol} was lost, another worker took it over")
+
+
+def fail_job(batch_id, symbol, worker, error):
+    # Goes back to the queue until the job has used up its attempts
+    with transaction() as connection:
+        connection.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'pending' "
+            "ELSE 'failed' END, worker = NULL, lease_expires = NULL, error = ?, "
+            "updated_at = ? WHERE batch_id = ? AND symbol = ? AND worker = ? "
+            "AND status = 'leased'",
+            (max_attempts, error, now_iso(), batch_id, symbol, worker),
+        )
+
+
+def get_batch_jobs(batch_id):
+    with transaction() as connection:
+        return [
+            dict(row)
+            for row in connection.execute(
+                "SELECT * FROM jobs WHERE batch_id = ? ORDER BY position", (batch_id,)
+            )
+        ]
+
+
+def get_latest_batch_id():
+    with transaction() as connection:
+        row = connection.execute(
+            "SELECT batch_id FROM jobs ORDER BY created_at DESC LIMIT 1"
+        ).fetchone()
+    return row["batch_id"] if row else None
+
+
+def count_statuses(jobs):
+    counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+    for job in jobs:
+        counts[job["status"]] += 1
+    return counts
+
+
+# --- Worker ---
+def run_worker(batch_id=None, keep_polling=False):
+    # Every worker process reads its own .env/environment, so each one drives
+    # the browser of its own ENDPOINT_URL
+    import main
+    from instrumentation import current_run_id
+
+    print_status(f"Worker {worker_id} started")
+    in_flight = {}
+    in_flight_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def claimed_symbols():
+        # Jobs are claimed as the pipeline asks for the next symbol, so a
+        # worker never holds more leases than it can work on
+        while True:
+            job = claim_job(worker_id, batch_id)
+            if job is None:
+                if not keep_polling:
+                    return
+                time.sleep(POLL_SECONDS)
+                continue
+            job_batch, symbol = job
+            with in_flight_lock:
+                in_flight.setdefault(symbol, []).append(job_batch)
+            print_status(f"Worker {worker_id} claimed {symbol} of batch {job_batch}")
+            # Workers share DOWNLOAD_DIRECTORY, screenshots and setups of an
+            # earlier batch or of a crashed worker must not reach the models
+            if "capture" in main.pipeline_stages and not main.incremental_mode:
+                clear_symbol_directory(symbol)
+            yield symbol
+
+    def take_in_flight(item):
+        # Stage items are the symbol or a tuple starting with it
+        symbol = item[0] if isinstance(item, tuple) else item
+        with in_flight_lock:
+            job_batch = in_flight[symbol].pop(0)
+            if not in_flight[symbol]:
+                del in_flight[symbol]
+        return job_batch, symbol
+
+    def symbol_done(result):
+        job_batch, symbol = take_in_flight(result)
+        complete_job(job_batch, symbol, worker_id, current_run_id())
+
+    def symbol_failed(item, error):
+        # Goes back to the queue right away instead of when the run ends
+        job_batch, symbol = take_in_flight(item)
+        fail_job(job_batch, symbol, worker_id, str(error))
+
+    def heartbeat():
+        while not stopped.wait(max(1, lease_seconds / 3)):
+            with in_flight_lock:
+                jobs = [
+                    (job_batch, symbol)
+                    for symbol, batches in in_flight.items()
+                    for job_batch in batches
+                ]
+            try:
+                renew_leases(worker_id, jobs)
+            except sqlite3.Error as e:
+                print_status(f"Failed to renew leases: {e}")
+
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+    try:
+        main.run_pipeline(
+            claimed_symbols(),
+            on_symbol_done=symbol_done,
+            on_symbol_failed=symbol_failed,
+        )
+    finally:
+        stopped.set()
+        # Symbols still in flight when the run stopped go back to the queue
+        with in_flight_lock:
+            for symbol, batches in in_flight.items():
+                for job_batch in batches:
+                    fail_job(job_batch, symbol, worker_id, "not completed")
+        main.close_openai_clients()
+    print_status(f"Worker {worker_id} finished")
+
+
+# --- Coordinator ---
+def merge_batch(batch_id, output=None):
+    # The workers' results of the batch are merged into one consolidated report
+    from excel_export import ConsolidatedReport
+    from results_store import query_summaries, store_enabled
+
+    if not store_enabled():
+        raise ValueError("Merging needs the results store (RESULTS_DB)")
+
+    jobs = get_batch_jobs(batch_id)
+    output = output or os.path.join(
+        get_download_directory(), f"trading_summaries-{batch_id}.xlsx"
+    )
+    report = ConsolidatedReport(output)
+    for job in jobs:
+        if job["status"] != "done":
+            print_status(f"{job['symbol']} is {job['status']}, not merged")
+            continue
+        symbol_name = job["symbol"].split(":")[1]
+        summaries = query_summaries(run_id=job["run_id"], symbol=symbol_name)
+        report.add_symbol(symbol_name, summaries)
+    return report.close()
+
+
+def wait_for_batch(batch_id):
+    while True:
+        counts = count_statuses(get_batch_jobs(batch_id))
+        if not counts["pending"] and not counts["leased"]:
+            return counts
+        time.sleep(POLL_SECONDS)
+
+
+# --- Command Line Interface ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Share the symbols between several worker processes."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Queue a batch of symbols")
+    enqueue.add_argument("symbols", nargs="*", help="Defaults to SYMBOLS")
+    enqueue.add_argument("--batch", help="Batch ID, generated when omitted")
+
+    worker = commands.add_parser("worker", help="Work on queued symbols")
+    worker.add_argument("--batch", help="Only take jobs of this batch")
+    worker.add_argument(
+        "--keep-polling", action="store_true", help="Wait for new jobs when idle"
+    )
+
+    status = commands.add_parser("status", help="Show the jobs of a batch")
+    status.add_argument("--batch", help="Defaults to the latest batch")
+
+    merge = commands.add_parser("merge", help="Merge a batch into one report")
+    merge.add_argument("--batch", help="Defaults to the latest batch")
+    merge.add_argument("--output", help="Path of the .xlsx file")
+    merge.add_argument(
+        "--wait", action="store_true", help="Wait until every job is finished"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.command == "enqueue":
+        symbols = args.symbols or json.loads(config("SYMBOLS"))
+        batch_id = enqueue_batch(symbols, args.batch)
+        print_status(f"Queued {len(symbols)} symbols as batch {batch_id}")
+        print(batch_id)
+        return 0
+
+    if args.command == "worker":
+        run_worker(args.batch, args.keep_polling)
+        return 0
+
+    batch_id = args.batch or get_latest_batch_id()
+    if batch_id is None:
+        print_status("The work queue is empty")
+        return 1
+
+    if args.command == "status":
+        jobs = get_batch_jobs(batch_id)
+        for job in jobs:
+            print(
+                f"{job['symbol']:<20} {job['status']:<8} attempts {job['attempts']} "
+                f"worker {job['worker'] or '-'} {job['error'] or ''}"
+            )
+        print_status(f"Batch {batch_id}: {count_statuses(jobs)}")
+        return 0
+
+    if args.wait:
+        wait_for_batch(batch_id)
+    report_path = merge_batch(batch_id, args.output)
+    if report_path is None:
+        print_status(f"Batch {batch_id} has no finished symbols to merge")
+        return 1
+    print_status(f"Batch {batch_id} merged into {report_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())